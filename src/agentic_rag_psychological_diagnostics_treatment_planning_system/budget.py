@@ -0,0 +1,137 @@
+"""
+Per-Step Turn Budgets for the Conversational Diagnostic Agent
+Bounds the iterations, tool calls and wall-clock time a single turn may use,
+and counts budget exhaustion events so tail latency stays observable.
+"""
+
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Tuple
+
+
+# Share of the deadline held back so the agent can still write its answer
+# after tools have been cut off
+FINALIZE_RESERVE_FRACTION = 0.25
+
+_exhaustion_counts: Counter = Counter()
+_exhaustion_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class StepBudget:
+    """Limits for one agent turn within a diagnostic step"""
+    max_iter: int
+    max_tool_calls: int
+    deadline_seconds: float
+
+
+class TurnBudget:
+    """Tracks one turn's consumption against its step budget"""
+
+    def __init__(self, step: int, budget: StepBudget):
+        self.step = step
+        self.budget = budget
+        self.started = time.monotonic()
+        self.deadline = self.started + budget.deadline_seconds
+        self.iterations = 0
+        self.tool_calls = 0
+        self.exhausted = set()
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        """Seconds left before the turn deadline"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def tool_time_remaining(self) -> float:
+        """Seconds a tool call may run while leaving the finalize reserve intact"""
+        return max(0.0, self.remaining() - self.budget.deadline_seconds * FINALIZE_RESERVE_FRACTION)
+
+    def expired(self) -> bool:
+        """Whether the turn deadline has passed"""
+        return self.remaining() <= 0.0
+
+    def record_iteration(self):
+        """Count an agent step, recording exhaustion when max_iter is reached"""
+        with self._lock:
+            self.iterations += 1
+            reached = self.iterations >= self.budget.max_iter
+        if reached:
+            self.record_exhaustion('iterations')
+
+    def try_acquire_tool_call(self) -> bool:
+        """
+        Reserve a tool call against the budget
+
+        Returns:
+            bool: False when the tool-call allowance or tool time is used up
+        """
+        if self.tool_time_remaining() <= 0.0:
+            self.record_exhaustion('deadline')
+            return False
+        with self._lock:
+            if self.tool_calls >= self.budget.max_tool_calls:
+                allowed = False
+            else:
+                self.tool_calls += 1
+                allowed = True
+        if not allowed:
+            self.record_exhaustion('tool_calls')
+        return allowed
+
+    def record_exhaustion(self, reason: str):
+        """Count a budget exhaustion event, once per reason per turn"""
+        with self._lock:
+            if reason in self.exhausted:
+                return
+            self.exhausted.add(reason)
+        with _exhaustion_lock:
+            _exhaustion_counts[(self.step, reason)] += 1
+        print(
+            f"Turn budget exhausted: step {self.step}, {reason} "
+            f"({time.monotonic() - self.started:.1f}s of {self.budget.deadline_seconds:g}s, "
+            f"{self.iterations}/{self.budget.max_iter} iterations, "
+            f"{self.tool_calls}/{self.budget.max_tool_calls} tool calls)"
+        )
+
+
+def run_with_deadline(func: Callable[..., Any], timeout: float, *args, **kwargs) -> Any:
+    """
+    Run `func` in its own daemon thread and wait at most `timeout` seconds
+
+    Each call gets a fresh thread, so a call that overruns keeps running in
+    the background without holding up the caller or occupying a slot any
+    later call needs.
+
+    Raises:
+        TimeoutError: If `func` has not returned within `timeout`
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = func(*args, **kwargs)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True, name="budgeted-call")
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"Call exceeded {timeout:.1f}s")
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+
+def get_budget_exhaustion_counts() -> Dict[Tuple[int, str], int]:
+    """Budget exhaustion events so far, keyed by (step, reason)"""
+    with _exhaustion_lock:
+        return dict(_exhaustion_counts)
+
+
+def reset_budget_exhaustion_counts():
+    """Clear the exhaustion counters"""
+    with _exhaustion_lock:
+        _exhaustion_counts.clear()
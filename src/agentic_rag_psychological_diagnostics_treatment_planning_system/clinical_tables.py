@@ -0,0 +1,604 @@
+"""
+Precompiled Clinical Lookup Tables for Diagnosis and Outcome Measures
+Compiles dsm5_criteria.pdf into a structured disorder -> criteria table and
+outcome_measures.pdf into an instrument index, and matches the information
+collected in Steps 1-3 against them without any LLM or embedding calls.
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from .knowledge_index import KNOWLEDGE_DIR
+
+
+DEFAULT_TABLES_DIR = os.path.join("db", "clinical_tables")
+DSM5_CRITERIA_PDF = "dsm5_criteria.pdf"
+OUTCOME_MEASURES_PDF = "outcome_measures.pdf"
+DSM5_CRITERIA_TABLE = "dsm5_criteria.json"
+OUTCOME_MEASURES_TABLE = "outcome_measures.json"
+# Bumped when the compiled table layout changes, so tables written by an older version are recompiled
+TABLE_FORMAT_VERSION = 2
+
+# Share of a candidate's score from symptom criteria; the rest comes from duration and impairment
+SYMPTOM_WEIGHT = 0.75
+
+# Clinical concepts and the terms that express them. Criteria items and
+# patient information are both reduced to concept sets, so "can't sleep"
+# matches "Insomnia or hypersomnia" and "Sleep disturbance". Terms match whole
+# words; a trailing * marks a stem that may be extended ("worr*" matches
+# "worried"), and multi-word terms match consecutive words. Ambiguous words
+# ("down", "control", "death", "interest") only count inside a phrase.
+CONCEPT_TERMS = {
+    'depressed_mood': ['depress*', 'sad', 'sadness', 'hopeless*', 'tearful', 'emptiness', 'feel empty',
+                       'feeling empty', 'feel down', 'feeling down', 'felt down', 'low mood'],
+    'anhedonia': ['anhedon*', 'pleasure', 'diminished interest', 'lost interest', 'loss of interest', 'no interest',
+                  "don't enjoy", 'no longer enjoy', "can't enjoy"],
+    'appetite': ['appetite', 'eat', 'eating', 'eats', 'ate', 'weight', 'hunger', 'hungry', 'food'],
+    'sleep': ['sleep*', 'slept', 'insomnia', 'hypersomnia'],
+    'restlessness': ['restless*', 'agitat*', 'keyed up', 'on edge', 'psychomotor'],
+    'fatigue': ['fatigu*', 'tired*', 'exhaust*', 'drained', 'loss of energy', 'low energy', 'no energy',
+                'lack of energy'],
+    'worthlessness': ['worthless*', 'guilt*', 'useless'],
+    'concentration': ['concentrat*', 'focus*', 'indecisi*', 'attention', 'mind going blank', 'mind goes blank'],
+    'suicidal': ['suicid*', 'kill myself', 'end my life', 'want to die', 'wish i was dead', 'better off dead',
+                 'thoughts of death'],
+    'worry': ['worr*', 'anxi*', 'nervous*', 'fear', 'fears', 'fearful', 'afraid', 'apprehens*', 'dread*'],
+    'uncontrollable': ['uncontrollab*', 'difficult to control', 'hard to control', "can't control", 'cannot control',
+                       'unable to control', 'out of control', "can't stop", 'cannot stop'],
+    'irritability': ['irritab*', 'irritated', 'angry', 'anger', 'outburst*', 'temper'],
+    'muscle_tension': ['muscle*', 'tense'],
+    'trauma_exposure': ['trauma*', 'assault*', 'accident*', 'abuse*', 'violence', 'violent', 'combat', 'injur*'],
+    'intrusions': ['flashback*', 'intrusi*', 'memories', 'nightmare*', 'distressing dreams', 'reliv*'],
+    'avoidance': ['avoid*'],
+    'hypervigilance': ['hypervigil*', 'startle*', 'jumpy'],
+    'detachment': ['detach*', 'estrange*', 'numb*', 'disconnect*', 'unreal*', 'dissociat*', 'not real',
+                   'touch with reality'],
+    'reckless': ['reckless*', 'destructive'],
+    'hyperactivity': ['fidget*', 'squirm*', 'hyperactiv*', 'interrupt*', 'intrude*', 'blurt*', 'driven by a motor'],
+    'inattention': ['careless*', 'forget*', 'loses things', 'losing things', 'lose things', 'organizing', 'disorganiz*',
+                    'distract*', 'not seem to listen', "don't listen", 'not listening'],
+}
+
+_WORD_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+# First word of each term -> [(concept, remaining words)], split by whole words and stems
+_TERM_WORDS: Dict[str, List[tuple]] = {}
+_TERM_STEMS: Dict[str, List[tuple]] = {}
+for _concept, _terms in CONCEPT_TERMS.items():
+    for _term in _terms:
+        _first, *_rest = _term.split()
+        if _first.endswith('*'):
+            _TERM_STEMS.setdefault(_first[:-1], []).append((_concept, _rest))
+        else:
+            _TERM_WORDS.setdefault(_first, []).append((_concept, _rest))
+_STEM_LENGTHS = sorted({len(stem) for stem in _TERM_STEMS})
+
+_NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+    'couple': 2, 'few': 3, 'several': 3,
+}
+_UNIT_DAYS = {'day': 1, 'week': 7, 'month': 30, 'year': 365}
+_DURATION_PATTERN = re.compile(
+    r"\b(\d+|" + "|".join(_NUMBER_WORDS) + r")\+?(?:\s+of)?[\s-]*(day|week|month|year)s?\b", re.IGNORECASE
+)
+_MIN_COUNT_PATTERN = re.compile(
+    r"\b(\d+|" + "|".join(_NUMBER_WORDS) + r")\s*\(?(?:or more|\+)", re.IGNORECASE
+)
+
+_DISORDER_HEADING = re.compile(r"^(?P<name>[A-Z][^()]+?)\s*\((?P<code>\d{3}\.[\dx]+(?:-\d{3}\.[\dx]+)?)\)$")
+_CRITERION_LINE = re.compile(r"^(?P<id>[A-Z])\.\s+(?P<text>.+)$")
+_CRITERIA_END_LINES = ('Specifiers', 'Presentation Specifiers', 'Severity Ratings', 'Diagnostic Process Guidelines')
+_EXCLUSION_PATTERN = re.compile(r"not attributable|not better explained|no history of", re.IGNORECASE)
+_IMPAIRMENT_PATTERN = re.compile(r"distress or impairment|interfere", re.IGNORECASE)
+# "at least one symptom is either (1) or (2)": items a group can't be met without
+_REQUIRED_ITEMS_PATTERN = re.compile(r"at least one[^:;.]*?\bis either\s+((?:\(\d+\)(?:,\s*|\s+or\s+)?)+)", re.IGNORECASE)
+
+_DOMAIN_HEADING = re.compile(r"^(?P<numeral>[IVX]+)\.\s+(?P<title>.+)$")
+_INSTRUMENT_HEADING = re.compile(r"^[A-H]\.\s+(?P<name>.+?)(?:\s*\((?P<abbreviation>[^)]+)\)?)?$")
+_SCORE_BAND_LINE = re.compile(r"^(?P<low>\d+)-(?P<high>\d+):?(?:\s+(?P<label>.*))?$")
+
+
+def _term_word_matches(pattern: str, word: str) -> bool:
+    return word.startswith(pattern[:-1]) if pattern.endswith('*') else word == pattern
+
+
+def concepts_in(text: str) -> Set[str]:
+    """Clinical concepts mentioned in a piece of text"""
+    words = _WORD_PATTERN.findall(text.lower().replace('\u2019', "'"))
+    concepts = set()
+    for position, word in enumerate(words):
+        candidates = list(_TERM_WORDS.get(word, ()))
+        for length in _STEM_LENGTHS:
+            if length > len(word):
+                break
+            candidates.extend(_TERM_STEMS.get(word[:length], ()))
+        for concept, rest in candidates:
+            following = words[position + 1:position + 1 + len(rest)]
+            if len(following) == len(rest) and all(map(_term_word_matches, rest, following)):
+                concepts.add(concept)
+    return concepts
+
+
+def parse_duration_days(text: str) -> Optional[int]:
+    """Longest duration mentioned in free text, in days (e.g. '6 months' -> 180)"""
+    durations = [
+        (int(amount) if amount.isdigit() else _NUMBER_WORDS[amount.lower()]) * _UNIT_DAYS[unit.lower()]
+        for amount, unit in _DURATION_PATTERN.findall(text or "")
+    ]
+    return max(durations) if durations else None
+
+
+def _parse_min_count(text: str) -> Optional[int]:
+    """Minimum item count from phrases like 'Five (or more)', '(2 or more)' or '5+ for adults'"""
+    counts = [int(n) if n.isdigit() else _NUMBER_WORDS[n.lower()] for n in _MIN_COUNT_PATTERN.findall(text)]
+    # Where child and adult thresholds differ the adult one comes last
+    return counts[-1] if counts else None
+
+
+def _parse_required_items(text: str) -> List[int]:
+    """Zero-based item positions from a constraint like 'at least one symptom is either (1) or (2)'"""
+    required = _REQUIRED_ITEMS_PATTERN.search(text)
+    return [int(n) - 1 for n in re.findall(r"\((\d+)\)", required.group(1))] if required else []
+
+
+def _pdf_lines(pdf_path: str) -> List[str]:
+    from pypdf import PdfReader
+
+    lines = []
+    for page in PdfReader(pdf_path).pages:
+        lines.extend(line.strip() for line in (page.extract_text() or "").splitlines())
+    return [line for line in lines if line]
+
+
+def _continues(previous: str, line: str) -> bool:
+    """Whether `line` is the wrapped tail of `previous` rather than a new entry"""
+    return line[0].islower() or previous.endswith('-') or line[0] in '(&'
+
+
+def _join(previous: str, line: str) -> str:
+    return previous + line if previous.endswith('-') else f"{previous} {line}"
+
+
+def compile_dsm5_criteria(lines: List[str]) -> List[Dict[str, Any]]:
+    """
+    Compile the DSM-5 criteria reference into a structured table
+
+    Args:
+        lines (list): Text lines of dsm5_criteria.pdf
+
+    Returns:
+        list: One dict per disorder with its code and criteria. Each criterion
+        has an id, text, item groups with their minimum counts and required
+        items, and flags for duration thresholds, exclusions and impairment
+        requirements.
+    """
+    disorders = []
+    disorder = None
+    in_criteria = False
+    criterion = None
+    group = None
+    last = None  # (container, key) of the entry a wrapped line continues
+
+    for i, line in enumerate(lines):
+        heading = _DISORDER_HEADING.match(line)
+        if heading and i + 1 < len(lines) and lines[i + 1] == 'Diagnostic Criteria':
+            disorder = {'name': heading.group('name').strip(), 'code': heading.group('code'), 'criteria': []}
+            disorders.append(disorder)
+            in_criteria, criterion, group, last = False, None, None, None
+            continue
+        if disorder is None:
+            continue
+        if line == 'Diagnostic Criteria':
+            in_criteria = True
+            continue
+        if line in _CRITERIA_END_LINES:
+            in_criteria = False
+            continue
+        if not in_criteria:
+            continue
+
+        criterion_match = _CRITERION_LINE.match(line)
+        if criterion_match:
+            criterion = {'id': criterion_match.group('id'), 'text': criterion_match.group('text'), 'groups': []}
+            disorder['criteria'].append(criterion)
+            group = None
+            last = (criterion, 'text')
+            continue
+        if criterion is None:
+            continue
+
+        container, key = last
+        if _continues(container[key], line):
+            container[key] = _join(container[key], line)
+            # A wrapped item that now ends in ':' was really a group heading
+            if key == 'item' and container[key].endswith(':'):
+                group['items'].pop()
+                group = {'label': container[key].rstrip(':'), 'items': []}
+                criterion['groups'].append(group)
+                last = (group, 'label')
+            continue
+
+        if line.endswith(':'):
+            group = {'label': line.rstrip(':'), 'items': []}
+            criterion['groups'].append(group)
+            last = (group, 'label')
+            continue
+
+        if group is None:
+            group = {'label': None, 'items': []}
+            criterion['groups'].append(group)
+        item = {'item': line}
+        group['items'].append(item)
+        last = (item, 'item')
+
+    for disorder in disorders:
+        for criterion in disorder['criteria']:
+            criterion['groups'] = [
+                {
+                    'label': group['label'],
+                    'min_count': _parse_min_count(group['label'] or criterion['text']) or 1,
+                    'required_items': _parse_required_items(group['label'] or criterion['text']),
+                    'items': [item['item'] for item in group['items']],
+                }
+                for group in criterion['groups'] if group['items']
+            ]
+            criterion['duration_days'] = parse_duration_days(criterion['text'])
+            criterion['exclusion'] = bool(_EXCLUSION_PATTERN.search(criterion['text']))
+            criterion['impairment'] = bool(_IMPAIRMENT_PATTERN.search(criterion['text']))
+    return disorders
+
+
+def compile_outcome_measures(lines: List[str]) -> List[Dict[str, Any]]:
+    """
+    Compile the outcome measures guide into an instrument index
+
+    Args:
+        lines (list): Text lines of outcome_measures.pdf
+
+    Returns:
+        list: One dict per instrument with its domain, abbreviation, score bands
+        and key facts (cutoffs, change thresholds, scoring rules)
+    """
+    instruments = []
+    domain = None
+    instrument = None
+    band = None
+    fact_index = None
+
+    for line in lines:
+        domain_match = _DOMAIN_HEADING.match(line)
+        if domain_match:
+            title = domain_match.group('title')
+            domain = None
+            if 'Measures' in title:
+                domain = re.sub(r"\s+", " ", title.replace('Outcome Measures', '').replace('Measures', '')).strip()
+            instrument = None
+            continue
+        if domain is None:
+            continue
+
+        instrument_match = _INSTRUMENT_HEADING.match(line)
+        if instrument_match:
+            instrument = {
+                'name': instrument_match.group('name').strip(),
+                'abbreviation': (instrument_match.group('abbreviation') or '').strip(),
+                'domain': domain,
+                'score_bands': [],
+                'facts': [],
+            }
+            instruments.append(instrument)
+            band, fact_index = None, None
+            continue
+        if instrument is None:
+            continue
+
+        band_match = _SCORE_BAND_LINE.match(line)
+        if band_match:
+            band = {'low': int(band_match.group('low')), 'high': int(band_match.group('high')),
+                    'label': band_match.group('label') or ''}
+            instrument['score_bands'].append(band)
+            fact_index = None
+            continue
+        if line.endswith(':'):
+            band, fact_index = None, None
+            continue
+        if ': ' in line:
+            instrument['facts'].append(line)
+            band, fact_index = None, len(instrument['facts']) - 1
+            continue
+        if band is not None:
+            band['label'] = f"{band['label']} {line}".strip()
+        elif fact_index is not None and _continues(instrument['facts'][fact_index], line):
+            instrument['facts'][fact_index] = _join(instrument['facts'][fact_index], line)
+        elif instrument['abbreviation'] and not instrument['abbreviation'].endswith(')') and line.endswith(')') and not instrument['facts']:
+            # Abbreviation wrapped onto the next line, e.g. "(WHO-DAS" / "2.0)"
+            instrument['abbreviation'] = f"{instrument['abbreviation']} {line.rstrip(')')}"
+    return instruments
+
+
+def _source_fingerprint(pdf_path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(pdf_path):
+        return None
+    stat = os.stat(pdf_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def compile_clinical_tables(knowledge_dir: str = KNOWLEDGE_DIR, tables_dir: str = DEFAULT_TABLES_DIR) -> Dict[str, Any]:
+    """
+    Compile both lookup tables from the knowledge PDFs and write them to `tables_dir`
+
+    A table that can't be written (e.g. a read-only `db/`) is still returned,
+    so the caller can use it from memory.
+
+    Returns:
+        dict: {'dsm5_criteria': table, 'outcome_measures': table}
+    """
+    tables = {}
+    for key, pdf_name, table_name, compiler in (
+        ('dsm5_criteria', DSM5_CRITERIA_PDF, DSM5_CRITERIA_TABLE, compile_dsm5_criteria),
+        ('outcome_measures', OUTCOME_MEASURES_PDF, OUTCOME_MEASURES_TABLE, compile_outcome_measures),
+    ):
+        pdf_path = os.path.join(knowledge_dir, pdf_name)
+        source = _source_fingerprint(pdf_path)
+        entries = compiler(_pdf_lines(pdf_path)) if source else []
+        table = {'source': pdf_name, 'fingerprint': source, 'version': TABLE_FORMAT_VERSION, 'entries': entries}
+        table_path = os.path.join(tables_dir, table_name)
+        try:
+            os.makedirs(tables_dir, exist_ok=True)
+            with open(table_path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(table, f, indent=2)
+            os.replace(table_path + ".tmp", table_path)
+        except OSError as e:
+            print(f"Could not write clinical table {table_path}, using it from memory: {e}")
+        tables[key] = table
+    return tables
+
+
+class CriteriaMatcher:
+    """DSM-5 criteria table with a concept -> criteria item inverted index"""
+
+    def __init__(self, disorders: List[Dict[str, Any]]):
+        self.disorders = disorders
+        # concept -> [(disorder index, criterion index, group index, item index)]
+        self.item_index: Dict[str, List[tuple]] = {}
+        # key concept -> [(disorder index, criterion index)] for criteria without items
+        self.criterion_index: Dict[str, List[tuple]] = {}
+        self.concept_criteria: Set[tuple] = set()
+        criterion_concepts = {}
+        frequency: Dict[str, int] = {}
+        for d, disorder in enumerate(disorders):
+            for c, criterion in enumerate(disorder['criteria']):
+                if criterion['groups']:
+                    for g, group in enumerate(criterion['groups']):
+                        for i, item in enumerate(group['items']):
+                            for concept in concepts_in(item):
+                                self.item_index.setdefault(concept, []).append((d, c, g, i))
+                                frequency[concept] = frequency.get(concept, 0) + 1
+                elif not criterion['exclusion']:
+                    concepts = concepts_in(criterion['text'])
+                    if concepts:
+                        criterion_concepts[(d, c)] = concepts
+                        for concept in concepts:
+                            frequency[concept] = frequency.get(concept, 0) + 1
+        # A criterion without items is met only through its most distinctive
+        # concept, so "difficult to control the worry" needs the lack of
+        # control, not just a mention of worry
+        for (d, c), concepts in criterion_concepts.items():
+            key = min(concepts, key=lambda concept: (frequency[concept], concept))
+            self.criterion_index.setdefault(key, []).append((d, c))
+            self.concept_criteria.add((d, c))
+
+    def match(self, symptoms: Dict[str, Any], duration: Dict[str, Any], impact: Dict[str, Any],
+              top_n: int = 3) -> List[Dict[str, Any]]:
+        """
+        Score every disorder against the information collected in Steps 1-3
+
+        Args:
+            symptoms (dict): ConversationState.symptoms_collected
+            duration (dict): ConversationState.duration_info
+            impact (dict): ConversationState.functional_impact_info
+            top_n (int): Number of candidates to return
+
+        Returns:
+            list: Candidate dicts (name, code, score, matched items, duration
+            status, exclusions to rule out), best first. Disorders whose
+            symptom criteria are all met rank above partial matches,
+            whatever their scores.
+        """
+        patient_concepts = concepts_in(_flatten(symptoms) + " " + _flatten(impact) + " " + _flatten(duration))
+        if symptoms.get('eating_issues'):
+            patient_concepts.add('appetite')
+        if symptoms.get('sleep_issues'):
+            patient_concepts.add('sleep')
+        if symptoms.get('reality_perception'):
+            patient_concepts.add('detachment')
+        patient_days = parse_duration_days(_flatten(duration))
+        has_impairment = any(impact.get(key) for key in ('work_impact', 'relationship_impact', 'daily_activities', 'self_care'))
+
+        matched_items = {}
+        matched_criteria = set()
+        for concept in patient_concepts:
+            for d, c, g, i in self.item_index.get(concept, ()):
+                matched_items.setdefault((d, c, g), set()).add(i)
+            for d, c in self.criterion_index.get(concept, ()):
+                matched_criteria.add((d, c))
+
+        candidates = []
+        for d, disorder in enumerate(self.disorders):
+            # Symptom criteria decide the match; duration and impairment support it
+            components = []  # per symptom criterion, 1.0 when met
+            supporting = []
+            items = []
+            met = []
+            duration_status = None
+            for c, criterion in enumerate(disorder['criteria']):
+                if criterion['exclusion']:
+                    continue
+                if criterion['groups']:
+                    best = 0.0
+                    for g, group in enumerate(criterion['groups']):
+                        hits = matched_items.get((d, c, g), set())
+                        items.extend(group['items'][i] for i in sorted(hits))
+                        # A group with required items earns nothing until one of them is present
+                        required = group.get('required_items')
+                        if required and not hits.intersection(required):
+                            continue
+                        best = max(best, min(1.0, len(hits) / group['min_count']))
+                    components.append(best)
+                    if best >= 1.0:
+                        met.append(criterion['id'])
+                elif criterion['impairment']:
+                    supporting.append(1.0 if has_impairment else 0.0)
+                    if has_impairment:
+                        met.append(criterion['id'])
+                elif (d, c) in matched_criteria:
+                    components.append(1.0)
+                    met.append(criterion['id'])
+                elif (d, c) in self.concept_criteria:
+                    components.append(0.0)
+
+                if criterion['duration_days'] and duration_status is None:
+                    if patient_days is None:
+                        duration_status, value = 'unknown', 0.5
+                    elif patient_days >= criterion['duration_days']:
+                        duration_status, value = 'met', 1.0
+                    else:
+                        duration_status, value = 'not met', 0.0
+                    supporting.append(value)
+                    duration_status = f"{duration_status} (requires {criterion['duration_days']}+ days)"
+
+            symptom_score = sum(components) / len(components) if components else 0.0
+            if symptom_score > 0:
+                score = symptom_score
+                if supporting:
+                    score = SYMPTOM_WEIGHT * symptom_score + (1 - SYMPTOM_WEIGHT) * sum(supporting) / len(supporting)
+                candidates.append({
+                    'name': disorder['name'],
+                    'code': disorder['code'],
+                    'score': score,
+                    'symptoms_met': all(component >= 1.0 for component in components),
+                    'criteria_met': met,
+                    'matched_items': items,
+                    'duration': duration_status,
+                    'rule_out': [criterion['text'] for criterion in disorder['criteria'] if criterion['exclusion']],
+                })
+        # Partial credit (4 of 5 items) must not outrank a disorder whose criteria are all met
+        candidates.sort(key=lambda candidate: (candidate['symptoms_met'], candidate['score']), reverse=True)
+        return candidates[:top_n]
+
+
+class OutcomeMeasureIndex:
+    """Outcome measure instruments indexed by the clinical domain they track"""
+
+    def __init__(self, instruments: List[Dict[str, Any]]):
+        self.instruments = instruments
+        self.by_domain: Dict[str, List[Dict[str, Any]]] = {}
+        for instrument in instruments:
+            self.by_domain.setdefault(instrument['domain'], []).append(instrument)
+
+    def for_condition(self, condition: str, general_per_domain: int = 1) -> List[Dict[str, Any]]:
+        """
+        Instruments for a diagnosis plus general functional and quality-of-life measures
+
+        Args:
+            condition (str): Diagnosis or candidate disorder name
+            general_per_domain (int): Instruments taken from each general domain
+
+        Returns:
+            list: Instrument dicts, condition-specific ones first
+        """
+        words = set(re.findall(r"[a-z]{4,}", (condition or "").lower()))
+        stems = {word[:5] for word in words}
+        specific = []
+        general = []
+        for domain, instruments in self.by_domain.items():
+            domain_words = set(re.findall(r"[a-z]{4,}", domain.lower()))
+            if stems & ({word[:5] for word in domain_words} | domain_words):
+                specific.extend(instruments)
+            elif domain.startswith(('Functional', 'Quality of Life')):
+                general.extend(instruments[:general_per_domain])
+        return specific + general
+
+
+_tables_cache: Dict[str, Any] = {}
+_tables_lock = threading.Lock()
+
+
+def get_clinical_tables(knowledge_dir: str = KNOWLEDGE_DIR, tables_dir: str = DEFAULT_TABLES_DIR):
+    """
+    Return the process-wide (CriteriaMatcher, OutcomeMeasureIndex)
+
+    Loads the compiled tables, recompiling them only when missing or when the
+    source PDFs have changed. Run `compile_clinical_tables` at deploy time to
+    keep compilation off the request path.
+    """
+    fingerprints = (
+        _source_fingerprint(os.path.join(knowledge_dir, DSM5_CRITERIA_PDF)),
+        _source_fingerprint(os.path.join(knowledge_dir, OUTCOME_MEASURES_PDF)),
+    )
+    with _tables_lock:
+        if _tables_cache.get('fingerprints') != fingerprints:
+            tables = {}
+            try:
+                for key, table_name in (('dsm5_criteria', DSM5_CRITERIA_TABLE), ('outcome_measures', OUTCOME_MEASURES_TABLE)):
+                    with open(os.path.join(tables_dir, table_name), encoding='utf-8') as f:
+                        tables[key] = json.load(f)
+            except (OSError, ValueError):
+                tables = {}
+            if (not tables or tables['dsm5_criteria']['fingerprint'] != fingerprints[0]
+                    or tables['outcome_measures']['fingerprint'] != fingerprints[1]
+                    or any(table.get('version') != TABLE_FORMAT_VERSION for table in tables.values())):
+                try:
+                    tables = compile_clinical_tables(knowledge_dir, tables_dir)
+                except Exception as e:
+                    # Cached as empty for these sources, so a bad PDF isn't re-parsed every turn
+                    print(f"Clinical tables could not be compiled, continuing without them: {e}")
+                    tables = {'dsm5_criteria': {'entries': []}, 'outcome_measures': {'entries': []}}
+            _tables_cache['fingerprints'] = fingerprints
+            _tables_cache['tables'] = (
+                CriteriaMatcher(tables['dsm5_criteria']['entries']),
+                OutcomeMeasureIndex(tables['outcome_measures']['entries']),
+            )
+        return _tables_cache['tables']
+
+
+def _flatten(values: Dict[str, Any]) -> str:
+    """Join the text values of a collected-information dict"""
+    parts = []
+    for value in values.values():
+        if isinstance(value, str):
+            parts.append(value)
+        elif isinstance(value, list):
+            parts.extend(str(item) for item in value)
+    return " ".join(parts)
+
+
+def run():
+    """
+    Command line entry point: compile the clinical lookup tables at deploy time
+    """
+    parser = argparse.ArgumentParser(description="Compile the DSM-5 criteria and outcome measures lookup tables")
+    parser.add_argument('--knowledge-dir', default=KNOWLEDGE_DIR)
+    parser.add_argument('--tables-dir', default=DEFAULT_TABLES_DIR)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    tables = compile_clinical_tables(args.knowledge_dir, args.tables_dir)
+    elapsed = time.perf_counter() - started
+
+    print(f"\n=== Compiled clinical tables into {args.tables_dir}/ in {elapsed:.2f}s ===\n")
+    for disorder in tables['dsm5_criteria']['entries']:
+        items = sum(len(group['items']) for criterion in disorder['criteria'] for group in criterion['groups'])
+        print(f"{disorder['name']} ({disorder['code']}): {len(disorder['criteria'])} criteria, {items} items")
+    print()
+    for instrument in tables['outcome_measures']['entries']:
+        print(f"{instrument['domain']}: {instrument['name']} ({instrument['abbreviation']})")
+
+
+if __name__ == "__main__":
+    run()
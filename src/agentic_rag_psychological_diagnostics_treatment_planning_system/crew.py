@@ -1,11 +1,13 @@
-import os
 from crewai import LLM
 from crewai import Agent, Crew, Process, Task
 from crewai.project import CrewBase, agent, crew, task
 from crewai_tools import (
-	PDFSearchTool,
 	SerperDevTool
 )
+from .models import ConversationTurn
+from .tools.budgeted_tool import BudgetedTool
+from .tools.knowledge_search_tool import KnowledgeSearchTool
+from .knowledge_index import get_knowledge_index
 # Removed HumanTool import - now using message-based approach
 
 
@@ -15,52 +17,55 @@ from crewai_tools import (
 class AgenticRagPsychologicalDiagnosticsTreatmentPlanningSystemCrew:
     """AgenticRagPsychologicalDiagnosticsTreatmentPlanningSystem crew"""
 
+    # Set per turn by the message handler; None runs without step budgets
+    turn_budget = None
+    # Knowledge snapshot pinned by the message handler for this turn; None uses the live one
+    knowledge_index = None
+    # Embedder config for crew memory; None uses CrewAI's default (OpenAI)
+    embedder = None
     
     @agent
     def conversational_diagnostic_coordinator(self) -> Agent:
         
-        embedding_config_pdfsearchtool = dict(
-            llm=dict(
-                provider="openai",
-                config=dict(
-                    model="gpt-4o",
-                ),
-            ),
-            embedder=dict(
-                provider="openai",
-                config=dict(
-                    model="text-embedding-3-large",
-                ),
-            ),
-        )
+        # Knowledge index snapshot over all PDFs in knowledge/, published by
+        # build_knowledge_index and hot-reloaded when the PDFs change
+        knowledge_index = self.knowledge_index if self.knowledge_index is not None else get_knowledge_index()
+        knowledge_tool = KnowledgeSearchTool(index=knowledge_index)
         
-        # PDFSearchTool - initialize empty then add PDFs dynamically
-        pdf_tool = PDFSearchTool(config=embedding_config_pdfsearchtool)
+        tools = [
+            knowledge_tool,
+            SerperDevTool()
+        ]
+        max_iter = 25
+        step_callback = None
+        llm_timeout = None
         
-        # Dynamically load all PDFs from knowledge directory
-        knowledge_dir = "knowledge"
-        if os.path.exists(knowledge_dir):
-            for filename in os.listdir(knowledge_dir):
-                if filename.endswith('.pdf'):
-                    pdf_path = os.path.join(knowledge_dir, filename)
-                    pdf_tool.add(pdf_path)
+        # Charge tools and iterations against the step budget, and bound each
+        # LLM request by the turn deadline. The deadline itself is enforced by
+        # the message handler: Agent.max_execution_time waits for the agent to
+        # finish before raising, and then discards its answer.
+        budget = self.turn_budget
+        if budget is not None:
+            tools = [BudgetedTool.wrap(tool, budget) for tool in tools]
+            max_iter = budget.budget.max_iter
+            step_callback = lambda step: budget.record_iteration()
+            llm_timeout = max(1.0, budget.remaining())
         
         return Agent(
             config=self.agents_config["conversational_diagnostic_coordinator"],
-            tools=[
-				pdf_tool,
-				SerperDevTool()
-            ],
+            tools=tools,
             reasoning=False,
             max_reasoning_attempts=None,
             inject_date=True,
             allow_delegation=False,
-            max_iter=25,
+            max_iter=max_iter,
             max_rpm=None,
             max_execution_time=None,
+            step_callback=step_callback,
             llm=LLM(
                 model="gpt-4o-mini",
                 temperature=0.7,
+                timeout=llm_timeout,
             ),
         )
     
@@ -118,6 +123,7 @@ class AgenticRagPsychologicalDiagnosticsTreatmentPlanningSystemCrew:
     def conversational_message_response(self) -> Task:
         return Task(
             config=self.tasks_config["conversational_message_response"],
+            output_pydantic=ConversationTurn,
             markdown=False,
         )
     
@@ -137,5 +143,6 @@ class AgenticRagPsychologicalDiagnosticsTreatmentPlanningSystemCrew:
             tasks=[self.conversational_message_response()],  # Only conversational task
             process=Process.sequential,
             memory=True,  # Enable memory for patient conversation continuity
+            embedder=self.embedder,
             verbose=True,
         )
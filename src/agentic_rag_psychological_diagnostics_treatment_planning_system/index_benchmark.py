@@ -0,0 +1,191 @@
+"""
+Knowledge Index Compression Benchmark
+Compares exact full-precision search over the knowledge index with int8
+search codes at several reduced dimensions, with and without the
+full-precision re-rank, on memory, query latency and recall@k.
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .knowledge_index import (
+    DEFAULT_INDEX_DIR,
+    EMBEDDING_MODEL,
+    KNOWLEDGE_DIR,
+    RERANK_CANDIDATES,
+    KnowledgeIndex,
+    KnowledgeSnapshotStore,
+    embed_texts,
+    quantize_embeddings,
+)
+
+
+# Queries of the kind the agent issues at each diagnostic step
+BENCHMARK_QUERIES = [
+    "DSM-5 criteria for generalized anxiety disorder",
+    "major depressive disorder symptoms duration two weeks",
+    "post-traumatic stress disorder intrusion and avoidance symptoms",
+    "ADHD inattention and hyperactivity criteria",
+    "panic attacks and agoraphobia",
+    "insomnia and loss of appetite with low mood",
+    "how to assess functional impairment at work and in relationships",
+    "CBT cognitive restructuring for anxiety",
+    "behavioral activation protocol for depression",
+    "exposure therapy session structure",
+    "DBT distress tolerance skills",
+    "DBT emotion regulation module",
+    "treatment plan goals and objectives format",
+    "measurable outcomes and progress monitoring",
+    "PHQ-9 score interpretation",
+    "GAD-7 severity bands",
+    "empathetic language when discussing a diagnosis",
+    "explaining treatment options to a patient",
+    "crisis and safety planning",
+    "frequency and duration of therapy sessions",
+]
+
+DIMENSION_OPTIONS = (3072, 1024, 512, 256, 128)
+RECALL_AT = (5, 10)
+LATENCY_REPEATS = 20
+
+
+def _row_ids(results: List[Dict[str, Any]]) -> List[tuple]:
+    return [(result['source'], result['page'], result['text']) for result in results]
+
+
+def resident_bytes(index: KnowledgeIndex) -> int:
+    """Bytes of search data a worker holds in memory, excluding memory-mapped embeddings"""
+    total = 0 if isinstance(index.embeddings, np.memmap) else index.embeddings.nbytes
+    if index.codes is not None:
+        total += index.codes.nbytes + index.code_scales.nbytes
+    return total
+
+
+def measure_configuration(name: str, index: KnowledgeIndex, query_vectors: np.ndarray,
+                          exact_ids: Dict[int, List[List[tuple]]], rerank_candidates: int,
+                          repeats: int, mapped_bytes: int) -> Dict[str, Any]:
+    """Time one search configuration and score its recall against the exact results"""
+    top_k = max(RECALL_AT)
+    latencies = []
+    recalls = {k: [] for k in RECALL_AT}
+    for q, query_vector in enumerate(query_vectors):
+        for _ in range(repeats):
+            started = time.perf_counter()
+            results = index.search_vector(query_vector, top_k, rerank_candidates=rerank_candidates)
+            latencies.append(time.perf_counter() - started)
+        found = _row_ids(results)
+        for k in RECALL_AT:
+            truth = set(exact_ids[k][q])
+            recalls[k].append(len(truth & set(found[:k])) / len(truth))
+
+    return {
+        'name': name,
+        'resident_bytes': resident_bytes(index),
+        'mapped_bytes': mapped_bytes,
+        'mean': float(np.mean(latencies)),
+        'p95': float(np.percentile(latencies, 95)),
+        'recall': {k: float(np.mean(values)) for k, values in recalls.items()},
+    }
+
+
+def benchmark_index(index: KnowledgeIndex, query_vectors: np.ndarray,
+                    dimension_options: Sequence[int] = DIMENSION_OPTIONS,
+                    rerank_candidates: int = RERANK_CANDIDATES,
+                    repeats: int = LATENCY_REPEATS) -> List[Dict[str, Any]]:
+    """
+    Benchmark search configurations over the same chunks and queries
+
+    The baseline is exact search over the full-precision embeddings held in
+    memory, which is what every worker did before search codes. Each other
+    configuration scans int8 codes of the first `d` dimensions, alone and
+    followed by the full-precision re-rank.
+
+    Args:
+        index (KnowledgeIndex): Index whose full-precision embeddings are the ground truth
+        query_vectors (np.ndarray): Normalised full-dimension query embeddings
+        dimension_options (list): Search code dimensions to try
+        rerank_candidates (int): Candidates re-scored at full precision
+        repeats (int): Timed searches per query
+
+    Returns:
+        list: One result dict per configuration, baseline first
+    """
+    embeddings = np.asarray(index.embeddings, dtype=np.float32)
+    exact = KnowledgeIndex(index.chunks, embeddings, index.manifest)
+    top_k = max(RECALL_AT)
+    exact_results = [_row_ids(exact.search_vector(query_vector, top_k)) for query_vector in query_vectors]
+    exact_ids = {k: [ids[:k] for ids in exact_results] for k in RECALL_AT}
+
+    rows = [measure_configuration("float32 exact", exact, query_vectors, exact_ids, 0, repeats, 0)]
+    for dimensions in dimension_options:
+        if dimensions > embeddings.shape[1]:
+            continue
+        codes, code_scales = quantize_embeddings(embeddings, dimensions)
+        # Mirror a loaded snapshot: codes in memory, full-precision rows only mapped
+        compressed = KnowledgeIndex(index.chunks, embeddings, index.manifest, codes, code_scales)
+        resident = codes.nbytes + code_scales.nbytes
+        for candidates, label in ((0, ""), (rerank_candidates, f" + re-rank {rerank_candidates}")):
+            row = measure_configuration(f"int8 d={dimensions}{label}", compressed, query_vectors,
+                                        exact_ids, candidates, repeats, embeddings.nbytes if candidates else 0)
+            row['resident_bytes'] = resident
+            rows.append(row)
+    return rows
+
+
+def format_report(rows: List[Dict[str, Any]], chunks: int, queries: int) -> str:
+    """Render benchmark results as a plain-text table"""
+    recall_headers = " ".join(f"{f'recall@{k}':>9}" for k in RECALL_AT)
+    lines = [
+        f"{chunks} chunks, {queries} queries",
+        "",
+        f"{'configuration':<28} {'resident MB':>12} {'mapped MB':>10} {'mean ms':>9} {'p95 ms':>9} {recall_headers}",
+    ]
+    for row in rows:
+        recalls = " ".join(f"{row['recall'][k]:>9.3f}" for k in RECALL_AT)
+        lines.append(
+            f"{row['name']:<28} {row['resident_bytes'] / 1e6:>12.3f} {row['mapped_bytes'] / 1e6:>10.3f} "
+            f"{row['mean'] * 1000:>9.3f} {row['p95'] * 1000:>9.3f} {recalls}"
+        )
+    return "\n".join(lines)
+
+
+def _query_vectors(index: KnowledgeIndex, chunk_queries: Optional[int]) -> np.ndarray:
+    if chunk_queries:
+        # Offline: perturbed chunk embeddings stand in for queries, avoiding embedding API calls
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(index), size=min(chunk_queries, len(index)), replace=False)
+        vectors = np.asarray(index.embeddings[np.sort(rows)], dtype=np.float32)
+        vectors = vectors + rng.normal(scale=0.5 / np.sqrt(vectors.shape[1]), size=vectors.shape)
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    return embed_texts(BENCHMARK_QUERIES, index.manifest.get('model', EMBEDDING_MODEL))
+
+
+def run():
+    """
+    Command line entry point for the index compression benchmark
+    """
+    parser = argparse.ArgumentParser(description="Benchmark compressed knowledge index search against exact search")
+    parser.add_argument('--knowledge-dir', default=KNOWLEDGE_DIR)
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--dimensions', default=",".join(str(d) for d in DIMENSION_OPTIONS),
+                        help="Comma-separated search code dimensions to compare")
+    parser.add_argument('--rerank-candidates', type=int, default=RERANK_CANDIDATES)
+    parser.add_argument('--repeats', type=int, default=LATENCY_REPEATS)
+    parser.add_argument('--chunk-queries', type=int, default=None,
+                        help="Use this many perturbed chunk embeddings as queries instead of embedding the query set")
+    args = parser.parse_args()
+
+    index = KnowledgeSnapshotStore(args.knowledge_dir, args.index_dir).current()
+    query_vectors = _query_vectors(index, args.chunk_queries)
+    dimension_options = [int(d) for d in args.dimensions.split(',') if d.strip()]
+
+    print(f"\n=== Knowledge index search benchmark ({args.index_dir}/) ===\n")
+    rows = benchmark_index(index, query_vectors, dimension_options, args.rerank_candidates, args.repeats)
+    print(format_report(rows, len(index), len(query_vectors)))
+
+
+if __name__ == "__main__":
+    run()
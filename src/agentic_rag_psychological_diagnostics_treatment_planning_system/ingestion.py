@@ -0,0 +1,312 @@
+"""
+Parallel PDF Ingestion Pipeline for the Knowledge Index
+Extracts and chunks PDFs in a process pool, drops duplicate chunks, and
+streams the rest into large embedding batches.
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .knowledge_index import (
+    DEFAULT_INDEX_DIR,
+    EMBEDDING_MODEL,
+    KNOWLEDGE_DIR,
+    SEARCH_DIMENSIONS,
+    KnowledgeIndex,
+    KnowledgeSnapshotStore,
+    embed_texts,
+    fingerprint_knowledge_dir,
+    quantize_embeddings,
+)
+
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+EMBEDDING_BATCH_SIZE = 512
+EMBEDDING_WORKERS = 4
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into chunks of roughly `chunk_size` characters on word boundaries
+
+    Consecutive chunks share about `chunk_overlap` characters of context.
+    """
+    words = text.split()
+    chunks = []
+    current = []
+    length = 0
+    for word in words:
+        if current and length + len(word) + 1 > chunk_size:
+            chunks.append(" ".join(current))
+            # Carry the tail of this chunk into the next one
+            overlap = []
+            overlap_length = 0
+            for tail_word in reversed(current):
+                if overlap_length + len(tail_word) + 1 > chunk_overlap:
+                    break
+                overlap.insert(0, tail_word)
+                overlap_length += len(tail_word) + 1
+            current = overlap
+            length = overlap_length
+        current.append(word)
+        length += len(word) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def extract_and_chunk(pdf_path: str, chunk_size: int = CHUNK_SIZE,
+                      chunk_overlap: int = CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """
+    Extract a PDF's text page by page and chunk it
+
+    Runs in a worker process, so it only takes and returns picklable values.
+
+    Returns:
+        list: Chunk dicts with 'text', 'source' and 'page'
+    """
+    from pypdf import PdfReader
+
+    source = os.path.basename(pdf_path)
+    chunks = []
+    for page_number, page in enumerate(PdfReader(pdf_path).pages, start=1):
+        page_text = page.extract_text() or ""
+        for text in chunk_text(page_text, chunk_size, chunk_overlap):
+            chunks.append({'text': text, 'source': source, 'page': page_number})
+    return chunks
+
+
+def _chunk_key(text: str) -> str:
+    """Dedup key: identical text modulo case and whitespace"""
+    normalized = re.sub(r"\s+", " ", text).strip().lower()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def _locations(chunk: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Every (source, page) a deduplicated chunk was found at; older indexes only kept the first"""
+    return chunk.get('sources') or [{'source': chunk['source'], 'page': chunk['page']}]
+
+
+def _with_locations(chunk: Dict[str, Any], locations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Copy of `chunk` citing the first of `locations`"""
+    return dict(chunk, source=locations[0]['source'], page=locations[0]['page'], sources=locations)
+
+
+def _reusable_chunks(previous: Optional[KnowledgeIndex], fingerprints: Dict[str, Dict[str, Any]],
+                     chunk_size: int, chunk_overlap: int, model: str):
+    """
+    What of `previous` can be carried into a new build
+
+    A chunk is carried over, with its embedding, while any file it was found
+    in is unchanged; locations in changed or removed files are dropped and
+    re-added if re-extraction finds the chunk again. Embeddings of every
+    previous chunk are also offered by content key, so re-extracted text that
+    was already embedded is not embedded again.
+
+    Returns:
+        tuple: (carried chunks, their embedding rows, names of the unchanged
+        files, {chunk key: embedding row} over all previous chunks)
+    """
+    if previous is None or len(previous) == 0:
+        return [], [], set(), {}
+    manifest = previous.manifest
+    if (manifest.get('model'), manifest.get('chunk_size'), manifest.get('chunk_overlap')) != (model, chunk_size, chunk_overlap):
+        return [], [], set(), {}
+
+    previous_files = manifest.get('files', {})
+    unchanged = {name for name, fingerprint in fingerprints.items() if previous_files.get(name) == fingerprint}
+    carried = []
+    rows = []
+    for row, chunk in enumerate(previous.chunks):
+        locations = [location for location in _locations(chunk) if location['source'] in unchanged]
+        if locations:
+            carried.append(_with_locations(chunk, locations))
+            rows.append(row)
+    known = {_chunk_key(chunk['text']): row for row, chunk in enumerate(previous.chunks)}
+    return carried, rows, unchanged, known
+
+
+def build_index(knowledge_dir: str = KNOWLEDGE_DIR, index_dir: Optional[str] = None,
+                workers: Optional[int] = None, batch_size: int = EMBEDDING_BATCH_SIZE,
+                embedding_workers: int = EMBEDDING_WORKERS, chunk_size: int = CHUNK_SIZE,
+                chunk_overlap: int = CHUNK_OVERLAP, model: str = EMBEDDING_MODEL,
+                previous: Optional[KnowledgeIndex] = None,
+                search_dimensions: Optional[int] = SEARCH_DIMENSIONS) -> KnowledgeIndex:
+    """
+    Build the knowledge index from every PDF in `knowledge_dir`
+
+    Files are extracted and chunked in a process pool. Their chunks are
+    consumed in filename order, so builds are deterministic, and each unique
+    chunk records every file and page it appears in. New chunks join a pending
+    batch, and full batches go straight to an embedding thread pool, so
+    embedding overlaps with extraction. Chunks of PDFs unchanged since
+    `previous` was built are carried over without re-extracting them, and
+    any chunk `previous` already embedded is not embedded again.
+
+    Args:
+        knowledge_dir (str): Directory of source PDFs
+        index_dir (str): Where to save the index, or None to keep it in memory only
+        workers (int): Extraction processes (defaults to the CPU count)
+        batch_size (int): Chunks per embedding request
+        embedding_workers (int): Concurrent embedding requests
+        chunk_size (int): Target characters per chunk
+        chunk_overlap (int): Characters shared between consecutive chunks
+        model (str): Embedding model
+        previous (KnowledgeIndex): Earlier index to reuse unchanged files and embeddings from
+        search_dimensions (int): Dimensions of the int8 search codes, or None for exact search only
+
+    Returns:
+        KnowledgeIndex: The built index; build statistics are in its manifest
+    """
+    started = time.perf_counter()
+    fingerprints = fingerprint_knowledge_dir(knowledge_dir)
+    carried, carried_rows, reused_files, known = _reusable_chunks(
+        previous, fingerprints, chunk_size, chunk_overlap, model
+    )
+    pdf_paths = [os.path.join(knowledge_dir, filename) for filename in fingerprints if filename not in reused_files]
+    workers = workers or os.cpu_count() or 1
+
+    chunks = list(carried)
+    # Where each chunk's vector comes from: ('previous', row) or ('batch', batch number, offset)
+    vector_refs = [('previous', row) for row in carried_rows]
+    by_key = {_chunk_key(chunk['text']): i for i, chunk in enumerate(chunks)}
+    pending = []
+    batches = []  # embedding futures in submission order
+    total_chunks = sum(len(chunk['sources']) for chunk in carried)
+    embeddings_reused = 0
+    extraction_seconds = 0.0
+
+    # Spawned, not forked: builds run from the watcher thread of a
+    # multi-threaded server, where a fork can copy a held lock into the child
+    spawn = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, max(1, len(pdf_paths))), mp_context=spawn) as extract_pool, \
+            ThreadPoolExecutor(max_workers=embedding_workers) as embed_pool:
+
+        def flush():
+            nonlocal pending
+            if pending:
+                texts = [chunks[i]['text'] for i in pending]
+                for offset, i in enumerate(pending):
+                    vector_refs[i] = ('batch', len(batches), offset)
+                batches.append(embed_pool.submit(embed_texts, texts, model))
+                pending = []
+
+        futures = [extract_pool.submit(extract_and_chunk, path, chunk_size, chunk_overlap) for path in pdf_paths]
+        # Consume in submission (filename) order, so which location a shared
+        # chunk cites first doesn't depend on which worker finished first
+        for future in futures:
+            for chunk in future.result():
+                total_chunks += 1
+                key = _chunk_key(chunk['text'])
+                location = {'source': chunk['source'], 'page': chunk['page']}
+                if key in by_key:
+                    chunks[by_key[key]]['sources'].append(location)
+                    continue
+                by_key[key] = len(chunks)
+                chunks.append(_with_locations(chunk, [location]))
+                if key in known:
+                    vector_refs.append(('previous', known[key]))
+                    embeddings_reused += 1
+                    continue
+                vector_refs.append(None)
+                pending.append(len(chunks) - 1)
+                if len(pending) >= batch_size:
+                    flush()
+        extraction_seconds = time.perf_counter() - started
+        flush()
+        batch_vectors = [future.result() for future in batches]
+
+    if chunks:
+        dimensions = batch_vectors[0].shape[1] if batch_vectors else previous.embeddings.shape[1]
+        embeddings = np.empty((len(chunks), dimensions), dtype=np.float32)
+        for i, ref in enumerate(vector_refs):
+            embeddings[i] = previous.embeddings[ref[1]] if ref[0] == 'previous' else batch_vectors[ref[1]][ref[2]]
+    else:
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+    codes = code_scales = None
+    if search_dimensions and len(chunks):
+        codes, code_scales = quantize_embeddings(embeddings, search_dimensions)
+    total_seconds = time.perf_counter() - started
+
+    manifest = {
+        'model': model,
+        'dimensions': int(embeddings.shape[1]) if len(chunks) else 0,
+        'search_dimensions': int(codes.shape[1]) if codes is not None else None,
+        'quantization': 'int8' if codes is not None else None,
+        'files': fingerprints,
+        'chunk_size': chunk_size,
+        'chunk_overlap': chunk_overlap,
+        'stats': {
+            'files': len(fingerprints),
+            'files_reused': len(reused_files),
+            'chunks_extracted': total_chunks,
+            'chunks_indexed': len(chunks),
+            'duplicates_removed': total_chunks - len(chunks),
+            'embeddings_reused': len(carried) + embeddings_reused,
+            'embedding_batches': len(batches),
+            'workers': workers,
+            'extraction_seconds': round(extraction_seconds, 3),
+            'total_seconds': round(total_seconds, 3),
+        },
+    }
+    index = KnowledgeIndex(chunks, embeddings, manifest, codes, code_scales)
+    if index_dir:
+        index.save(index_dir)
+    return index
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    """Render ingestion statistics for the CLI"""
+    return "\n".join([
+        f"Files:               {stats['files']} ({stats.get('files_reused', 0)} reused from the previous snapshot)",
+        f"Chunks extracted:    {stats['chunks_extracted']}",
+        f"Duplicates removed:  {stats['duplicates_removed']}",
+        f"Chunks indexed:      {stats['chunks_indexed']}",
+        f"Embeddings reused:   {stats.get('embeddings_reused', 0)}",
+        f"Embedding batches:   {stats['embedding_batches']}",
+        f"Extraction workers:  {stats['workers']}",
+        f"Extraction time:     {stats['extraction_seconds']:.2f}s",
+        f"Total ingestion:     {stats['total_seconds']:.2f}s",
+    ])
+
+
+def run():
+    """
+    Command line entry point: publish a fresh knowledge index snapshot at deploy time
+
+    Running workers pick the new snapshot up on their next watcher poll.
+    """
+    parser = argparse.ArgumentParser(description="Build and publish a knowledge index snapshot from the knowledge/ PDFs")
+    parser.add_argument('--knowledge-dir', default=KNOWLEDGE_DIR)
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Extraction processes (default: one per CPU core)")
+    parser.add_argument('--batch-size', type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument('--embedding-workers', type=int, default=EMBEDDING_WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--chunk-overlap', type=int, default=CHUNK_OVERLAP)
+    args = parser.parse_args()
+
+    print(f"\n=== Building knowledge index from {args.knowledge_dir}/ ===\n")
+    snapshot = KnowledgeSnapshotStore(args.knowledge_dir, args.index_dir).build(
+        workers=args.workers,
+        batch_size=args.batch_size,
+        embedding_workers=args.embedding_workers,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+    )
+    print(format_stats(snapshot.index.manifest['stats']))
+    print(f"\nPublished snapshot {snapshot.version} in {args.index_dir}/")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,545 @@
+"""
+Knowledge Index for the Diagnostic Agent
+Stores the embedded chunks of the knowledge/ PDFs as versioned on-disk
+snapshots and answers semantic search queries against them. Search scans
+compact int8 codes of dimension-reduced vectors and re-ranks the best
+candidates against the full-precision embeddings, which stay on disk.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+KNOWLEDGE_DIR = "knowledge"
+DEFAULT_INDEX_DIR = os.path.join("db", "knowledge_index")
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+MANIFEST_FILE = "manifest.json"
+CHUNKS_FILE = "chunks.jsonl"
+EMBEDDINGS_FILE = "embeddings.npy"
+CODES_FILE = "codes.npy"
+CODE_SCALES_FILE = "code_scales.npy"
+
+# Leading dimensions of the text-embedding-3 vectors kept for the compressed
+# search codes (the model is trained so a renormalised prefix is itself a
+# usable embedding). None keeps exact full-precision search only.
+SEARCH_DIMENSIONS = 512
+# Candidates from the compressed scan that are re-scored at full precision
+RERANK_CANDIDATES = 50
+# Scratch for dequantised code rows while scoring; small enough to stay in
+# cache, so int8 scoring costs about the same as float32 at equal dimensions
+SCORE_BLOCK_BYTES = 512 * 1024
+
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+BUILD_LOCK_FILE = "build.lock"
+# Superseded snapshots kept on disk for other worker processes still loading them
+RETAINED_SNAPSHOTS = 2
+WATCH_INTERVAL_SECONDS = 5.0
+STALE_BUILD_LOCK_SECONDS = 3600
+# How often a cold-starting process checks whether another one has published
+BUILD_WAIT_POLL_SECONDS = 1.0
+# Longest wait before the watcher retries a build that failed on unchanged PDFs
+MAX_REFRESH_BACKOFF_SECONDS = 600.0
+
+
+def fingerprint_knowledge_dir(knowledge_dir: str = KNOWLEDGE_DIR) -> Dict[str, Dict[str, Any]]:
+    """
+    Fingerprint the PDFs in the knowledge directory
+
+    Returns:
+        dict: {filename: {'size': bytes, 'mtime': seconds}} for every PDF
+    """
+    fingerprints = {}
+    if os.path.exists(knowledge_dir):
+        for filename in sorted(os.listdir(knowledge_dir)):
+            if filename.endswith('.pdf'):
+                stat = os.stat(os.path.join(knowledge_dir, filename))
+                fingerprints[filename] = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    return fingerprints
+
+
+def embed_texts(texts: List[str], model: str = EMBEDDING_MODEL, timeout: Optional[float] = None) -> np.ndarray:
+    """
+    Embed a batch of texts in a single API request
+
+    Args:
+        texts (list): Texts to embed
+        model (str): Embedding model
+        timeout (float): Seconds to wait for the request, without retries; None uses the client defaults
+
+    Returns:
+        np.ndarray: float32 array of shape (len(texts), dimensions), L2-normalised
+
+    Raises:
+        TimeoutError: If `timeout` elapses before the response arrives
+    """
+    from openai import APITimeoutError, OpenAI
+
+    client = OpenAI() if timeout is None else OpenAI(timeout=max(timeout, 0.001), max_retries=0)
+    try:
+        response = client.embeddings.create(model=model, input=texts)
+    except APITimeoutError as e:
+        raise TimeoutError(f"Embedding request exceeded {timeout}s") from e
+    vectors = np.asarray([item.embedding for item in response.data], dtype=np.float32)
+    return _normalize(vectors)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize_embeddings(embeddings: np.ndarray, dimensions: int):
+    """
+    Compress embeddings to int8 codes of their first `dimensions` dimensions
+
+    The truncated vectors are renormalised and each dimension is scaled
+    symmetrically so its largest magnitude maps to 127.
+
+    Returns:
+        tuple: (int8 codes of shape (n, dimensions), float32 per-dimension scales)
+    """
+    reduced = _normalize(np.asarray(embeddings[:, :dimensions], dtype=np.float32))
+    scales = np.abs(reduced).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(reduced / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class KnowledgeIndex:
+    """Embedded knowledge chunks with cosine-similarity search"""
+
+    def __init__(self, chunks: List[Dict[str, Any]], embeddings: np.ndarray, manifest: Dict[str, Any],
+                 codes: Optional[np.ndarray] = None, code_scales: Optional[np.ndarray] = None):
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.manifest = manifest
+        self.codes = codes
+        self.code_scales = code_scales
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def save(self, index_dir: str):
+        """Write the index to `index_dir`; the manifest is written last so readers never see a partial index"""
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, EMBEDDINGS_FILE), self.embeddings)
+        if self.codes is not None:
+            np.save(os.path.join(index_dir, CODES_FILE), self.codes)
+            np.save(os.path.join(index_dir, CODE_SCALES_FILE), self.code_scales)
+        with open(os.path.join(index_dir, CHUNKS_FILE), 'w', encoding='utf-8') as f:
+            for chunk in self.chunks:
+                f.write(json.dumps(chunk) + "\n")
+        manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "KnowledgeIndex":
+        """
+        Load an index written by save()
+
+        When the index has search codes, only the codes are read into memory;
+        the full-precision embeddings are memory-mapped, so a worker pages in
+        just the rows it re-ranks and the OS shares them between processes.
+        """
+        with open(os.path.join(index_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+        with open(os.path.join(index_dir, CHUNKS_FILE), encoding='utf-8') as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+        codes_path = os.path.join(index_dir, CODES_FILE)
+        if not os.path.exists(codes_path):
+            return cls(chunks, np.load(os.path.join(index_dir, EMBEDDINGS_FILE)), manifest)
+        embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode='r')
+        codes = np.load(codes_path)
+        code_scales = np.load(os.path.join(index_dir, CODE_SCALES_FILE))
+        return cls(chunks, embeddings, manifest, codes, code_scales)
+
+    def is_current(self, knowledge_dir: str = KNOWLEDGE_DIR) -> bool:
+        """Whether the index was built from the PDFs currently in `knowledge_dir`"""
+        return self.manifest.get('files') == fingerprint_knowledge_dir(knowledge_dir)
+
+    def search(self, query: str, top_k: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Find the chunks most similar to a query
+
+        Args:
+            query (str): Natural-language search query
+            top_k (int): Number of chunks to return
+            timeout (float): Seconds allowed for embedding the query; None uses the client defaults
+
+        Returns:
+            list: Chunk dicts with an added 'score', best first
+        """
+        if not self.chunks:
+            return []
+        query_vector = embed_texts([query], self.manifest.get('model', EMBEDDING_MODEL), timeout)[0]
+        return self.search_vector(query_vector, top_k)
+
+    def search_vector(self, query_vector: np.ndarray, top_k: int = 5,
+                      rerank_candidates: int = RERANK_CANDIDATES) -> List[Dict[str, Any]]:
+        """
+        Find the chunks most similar to an already-embedded, normalised query
+
+        Without search codes every full-precision embedding is scored. With
+        them, the codes are scanned and the best `rerank_candidates` chunks are
+        re-scored against their full-precision embeddings; 0 skips the re-rank
+        and returns the approximate scores.
+        """
+        if not self.chunks:
+            return []
+        if self.codes is None:
+            return self._rank(np.arange(len(self.chunks)), self.embeddings @ query_vector, top_k)
+
+        scores = self.code_scores(query_vector)
+        if rerank_candidates <= 0:
+            return self._rank(np.arange(len(scores)), scores, top_k)
+        candidates = self._rank_rows(scores, max(top_k, rerank_candidates))
+        # Sorted rows read the memory-mapped embeddings front to back
+        candidates.sort()
+        return self._rank(candidates, np.asarray(self.embeddings[candidates]) @ query_vector, top_k)
+
+    def code_scores(self, query_vector: np.ndarray) -> np.ndarray:
+        """
+        Approximate similarity of a full-dimension query to every chunk, from the int8 codes
+
+        numpy has no int8 matrix-vector product, so blocks of codes are widened
+        into one reused float32 buffer and scored with BLAS. The codes save
+        memory rather than compute; the speed-up over exact search comes from
+        the reduced dimensions.
+        """
+        rows, dimensions = self.codes.shape
+        query = _normalize(np.asarray(query_vector[None, :dimensions], dtype=np.float32))[0] * self.code_scales
+        block_rows = max(1, min(rows, SCORE_BLOCK_BYTES // (dimensions * 4)))
+        buffer = np.empty((block_rows, dimensions), dtype=np.float32)
+        scores = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, block_rows):
+            block = self.codes[start:start + block_rows]
+            widened = buffer[:len(block)]
+            widened[...] = block
+            np.dot(widened, query, out=scores[start:start + len(block)])
+        return scores
+
+    @staticmethod
+    def _rank_rows(scores: np.ndarray, top_k: int) -> np.ndarray:
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        return top[np.argsort(-scores[top])]
+
+    def _rank(self, rows: np.ndarray, scores: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        order = self._rank_rows(scores, top_k)
+        return [dict(self.chunks[rows[i]], score=float(scores[i])) for i in order]
+
+
+class KnowledgeSnapshot:
+    """An immutable, versioned knowledge index and the number of turns using it"""
+
+    def __init__(self, version: str, index: KnowledgeIndex):
+        self.version = version
+        self.index = index
+        self.refs = 0
+
+
+class KnowledgeSnapshotStore:
+    """
+    Versioned knowledge index snapshots with hot reload
+
+    Every build is written to its own immutable directory under
+    `<index_dir>/snapshots/` and published by atomically replacing the CURRENT
+    pointer file. Turns pin the snapshot they start on; a background watcher
+    builds the next snapshot when the PDFs change and swaps it in by pointer
+    assignment, so live sessions never wait on indexing. Superseded snapshots
+    are dropped once no in-flight turn references them.
+    """
+
+    def __init__(self, knowledge_dir: str = KNOWLEDGE_DIR, index_dir: str = DEFAULT_INDEX_DIR):
+        self.knowledge_dir = knowledge_dir
+        self.index_dir = index_dir
+        self.snapshots_dir = os.path.join(index_dir, SNAPSHOTS_DIR)
+        self._current: Optional[KnowledgeSnapshot] = None
+        self._retired: Dict[str, KnowledgeSnapshot] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
+
+    def current(self) -> KnowledgeIndex:
+        """The live knowledge index"""
+        return self._current_snapshot().index
+
+    @contextmanager
+    def pin(self):
+        """
+        Pin the live snapshot for the duration of a turn
+
+        Yields:
+            KnowledgeIndex: The snapshot's index, kept alive until the block exits
+        """
+        self._current_snapshot()
+        with self._lock:
+            snapshot = self._current
+            snapshot.refs += 1
+        try:
+            yield snapshot.index
+        finally:
+            with self._lock:
+                snapshot.refs -= 1
+                # Release a superseded snapshot's memory once its last turn ends;
+                # its directory is pruned later, off the request path
+                if snapshot.refs == 0 and self._retired.get(snapshot.version) is snapshot:
+                    del self._retired[snapshot.version]
+
+    def refresh(self) -> bool:
+        """
+        Bring the live snapshot up to date with the knowledge directory
+
+        Adopts a matching snapshot another process has already published,
+        otherwise builds and publishes a new one.
+
+        Returns:
+            bool: True if the live snapshot changed
+        """
+        with self._refresh_lock:
+            fingerprints = fingerprint_knowledge_dir(self.knowledge_dir)
+            current = self._current
+            if current is not None and current.index.manifest.get('files') == fingerprints:
+                return False
+
+            published = self._load_published()
+            if published is not None and published.index.manifest.get('files') == fingerprints:
+                if current is None or published.version != current.version:
+                    self._swap(published)
+                    return True
+                return False
+
+            if not self._acquire_build_lock():
+                # Another process is building; its snapshot is adopted on a later refresh
+                return False
+            try:
+                previous = current.index if current is not None else (published.index if published else None)
+                self._swap(self._build_snapshot(previous))
+            finally:
+                self._release_build_lock()
+            return True
+
+    def build(self, **build_options) -> KnowledgeSnapshot:
+        """
+        Build and publish a new snapshot, reusing unchanged files from the published one
+
+        Args:
+            **build_options: Extra keyword arguments for ingestion.build_index,
+                e.g. workers, batch_size or chunk_size
+        """
+        with self._refresh_lock:
+            # Wait out any watcher build in another process rather than racing it for CURRENT
+            while not self._acquire_build_lock():
+                time.sleep(BUILD_WAIT_POLL_SECONDS)
+            try:
+                published = self._load_published()
+                snapshot = self._build_snapshot(published.index if published else None, **build_options)
+            finally:
+                self._release_build_lock()
+            self._swap(snapshot)
+            return snapshot
+
+    def start_watcher(self, interval: float = WATCH_INTERVAL_SECONDS):
+        """Poll the knowledge directory in a daemon thread and refresh when it changes"""
+        if self._watcher is not None:
+            return
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), daemon=True,
+                                         name="knowledge-index-watcher")
+        self._watcher.start()
+
+    def stop_watcher(self):
+        """Stop the watcher thread"""
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval: float):
+        last_seen = fingerprint_knowledge_dir(self.knowledge_dir)
+        failed = None  # fingerprints the last failed refresh was attempted on
+        failures = 0
+        retry_at = 0.0
+        while not self._stop_watching.wait(interval):
+            seen = fingerprint_knowledge_dir(self.knowledge_dir)
+            # Only refresh once the directory has stopped changing, so a PDF
+            # that is still being copied in isn't indexed half-written. A
+            # build that failed is retried with backoff until the PDFs change.
+            if seen == last_seen and (seen != failed or time.monotonic() >= retry_at):
+                try:
+                    self.refresh()
+                    failed, failures = None, 0
+                except Exception as e:
+                    failures = failures + 1 if seen == failed else 1
+                    failed = seen
+                    delay = min(MAX_REFRESH_BACKOFF_SECONDS, interval * 2 ** failures)
+                    retry_at = time.monotonic() + delay
+                    print(f"Knowledge index refresh failed, keeping the current snapshot "
+                          f"and retrying in {delay:.0f}s: {e}")
+            self._collect_garbage()
+            last_seen = seen
+
+    def _current_snapshot(self) -> KnowledgeSnapshot:
+        snapshot = self._current
+        if snapshot is not None:
+            return snapshot
+        with self._refresh_lock:
+            if self._current is None:
+                # Serve the published snapshot straight away, even if stale; the
+                # watcher catches up. Only build inline when nothing was published.
+                published = self._load_published()
+                self._swap(published if published is not None else self._build_or_wait())
+            return self._current
+
+    def _build_or_wait(self) -> KnowledgeSnapshot:
+        """
+        Build the first snapshot, or adopt the one another process is building
+
+        Holding the build lock means cold-starting workers don't all extract
+        and embed the whole corpus at once: one builds, the rest wait for it
+        to publish.
+        """
+        while True:
+            if self._acquire_build_lock():
+                try:
+                    # It may have been published between our last check and taking the lock
+                    published = self._load_published()
+                    return published if published is not None else self._build_snapshot(None)
+                finally:
+                    self._release_build_lock()
+            time.sleep(BUILD_WAIT_POLL_SECONDS)
+            published = self._load_published()
+            if published is not None:
+                return published
+
+    def _swap(self, snapshot: KnowledgeSnapshot):
+        with self._lock:
+            previous = self._current
+            self._current = snapshot
+            if previous is not None and previous is not snapshot:
+                self._retired[previous.version] = previous
+        self._collect_garbage()
+
+    def _build_snapshot(self, previous: Optional[KnowledgeIndex], **build_options) -> KnowledgeSnapshot:
+        from .ingestion import build_index
+
+        if previous is not None:
+            # Watcher rebuilds keep the chunking a deploy-time build chose, so its embeddings stay reusable
+            for option in ('chunk_size', 'chunk_overlap'):
+                if option in previous.manifest:
+                    build_options.setdefault(option, previous.manifest[option])
+        index = build_index(self.knowledge_dir, index_dir=None, previous=previous, **build_options)
+        digest = hashlib.sha256(json.dumps(index.manifest['files'], sort_keys=True).encode('utf-8')).hexdigest()
+        version = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{digest[:8]}"
+        index.manifest['version'] = version
+
+        # Write into a staging directory and rename it into place, so a
+        # snapshot directory is never observed half-written
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        staging = os.path.join(self.snapshots_dir, f".staging-{version}-{os.getpid()}")
+        index.save(staging)
+        try:
+            os.rename(staging, os.path.join(self.snapshots_dir, version))
+        except OSError:
+            # Another process published the same version first
+            shutil.rmtree(staging, ignore_errors=True)
+
+        current_path = os.path.join(self.index_dir, CURRENT_FILE)
+        with open(current_path + f".{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(current_path + f".{os.getpid()}.tmp", current_path)
+        # Serve the published copy, so the full-precision embeddings are memory-mapped like on any other load
+        return KnowledgeSnapshot(version, KnowledgeIndex.load(os.path.join(self.snapshots_dir, version)))
+
+    def _load_published(self) -> Optional[KnowledgeSnapshot]:
+        current_path = os.path.join(self.index_dir, CURRENT_FILE)
+        if not os.path.exists(current_path):
+            return None
+        with open(current_path, encoding='utf-8') as f:
+            version = f.read().strip()
+        live = self._current
+        if live is not None and live.version == version:
+            return live
+        snapshot_dir = os.path.join(self.snapshots_dir, version)
+        if not os.path.exists(os.path.join(snapshot_dir, MANIFEST_FILE)):
+            return None
+        return KnowledgeSnapshot(version, KnowledgeIndex.load(snapshot_dir))
+
+    def _acquire_build_lock(self) -> bool:
+        lock_path = os.path.join(self.index_dir, BUILD_LOCK_FILE)
+        os.makedirs(self.index_dir, exist_ok=True)
+        for _ in range(2):
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) < STALE_BUILD_LOCK_SECONDS:
+                        return False
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+        return False
+
+    def _release_build_lock(self):
+        try:
+            os.remove(os.path.join(self.index_dir, BUILD_LOCK_FILE))
+        except FileNotFoundError:
+            pass
+
+    def _collect_garbage(self):
+        """Drop unpinned superseded snapshots from memory and prune old snapshot directories"""
+        with self._lock:
+            for version in [v for v, snapshot in self._retired.items() if snapshot.refs == 0]:
+                del self._retired[version]
+            keep = set(self._retired)
+            if self._current is not None:
+                keep.add(self._current.version)
+
+        if not os.path.isdir(self.snapshots_dir):
+            return
+        versions = sorted(name for name in os.listdir(self.snapshots_dir) if not name.startswith('.'))
+        superseded = [version for version in versions if version not in keep]
+        # Keep the newest few for other worker processes that may still be loading them
+        for version in superseded[:max(0, len(superseded) - RETAINED_SNAPSHOTS)]:
+            shutil.rmtree(os.path.join(self.snapshots_dir, version), ignore_errors=True)
+
+
+_store: Optional[KnowledgeSnapshotStore] = None
+_store_lock = threading.Lock()
+
+
+def get_knowledge_store(knowledge_dir: str = KNOWLEDGE_DIR, index_dir: str = DEFAULT_INDEX_DIR,
+                        watch: bool = True) -> KnowledgeSnapshotStore:
+    """
+    Return the process-wide snapshot store, starting its watcher on first use
+
+    Run `build_knowledge_index` at deploy time so the first turn loads a
+    published snapshot instead of building one inline.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = KnowledgeSnapshotStore(knowledge_dir, index_dir)
+            if watch:
+                _store.start_watcher()
+        return _store
+
+
+def get_knowledge_index() -> KnowledgeIndex:
+    """The live knowledge index of the process-wide snapshot store"""
+    return get_knowledge_store().current()
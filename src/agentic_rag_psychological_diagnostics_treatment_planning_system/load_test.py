@@ -0,0 +1,481 @@
+"""
+Load Testing Harness for the Conversational Diagnostic Agent
+Drives many synthetic patients concurrently through scripted six-step
+conversations against process_message. The LLM, web search, knowledge index
+and memory embeddings are stubbed, while the real crew runs every turn, so the
+numbers cover the handler and CrewAI's own overhead.
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import os
+import re
+import resource
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Type
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from crewai.llms.base_llm import BaseLLM
+from crewai.tools import BaseTool
+from crewai.utilities.paths import db_storage_path
+from pydantic import BaseModel, Field
+
+from . import crew as crew_module
+from . import message_handler
+from .budget import get_budget_exhaustion_counts, reset_budget_exhaustion_counts
+from .clinical_tables import CriteriaMatcher, OutcomeMeasureIndex
+from .models import ClinicalFields, ConversationTurn
+from .message_handler import initialize_session, process_message, is_assessment_complete, get_current_step
+
+
+# One scripted patient reply per diagnostic step. Each reply also carries the
+# keywords the heuristic fallback looks for, so a session advances one step per
+# turn when the handler is working as intended.
+PATIENT_SCRIPT = {
+    1: ("My anxiety is at a 9 and it comes and goes. Financial stress is the main trigger, "
+        "I can't eat or sleep properly, and being outside helps a little."),
+    2: "It started about 6 months ago and it is episodic, it comes in waves.",
+    3: "It affects my work a lot and I struggle to keep up with my daily routine.",
+    4: "What do you think is going on with me?",
+    5: "I'd like to go with option 1, the CBT approach.",
+    6: "Please put together my treatment plan.",
+}
+
+# Fields the stubbed agent "extracts" from each scripted reply
+STUB_EXTRACTED_FIELDS = {
+    1: dict(severity="anxiety 9/10", frequency="comes and goes", triggers=["financial stress"],
+            specific_symptoms=["loss of appetite", "insomnia"], coping_mechanisms=["being outside"]),
+    2: dict(symptom_duration="about 6 months", pattern="episodic"),
+    3: dict(work_impact="struggling at work", daily_activities="difficulty keeping up with routine"),
+    4: dict(diagnosis="Generalized Anxiety Disorder"),
+    5: dict(selected_treatment="Option 1: CBT"),
+    6: dict(),
+}
+
+STUB_TREATMENT_PLAN = "\n".join(
+    ["# Treatment Plan", ""] +
+    [f"## Section {i}\n" + "Evidence-based intervention details. " * 20 for i in range(1, 11)]
+)
+
+
+# Tool call the stubbed LLM makes before answering at each step, as the real
+# agent is instructed to: (tool name, action input)
+STUB_TOOL_CALLS = {
+    4: ("Search the clinical knowledge base", {'query': "DSM-5 criteria for generalized anxiety disorder"}),
+    5: ("Search the internet with Serper", {'search_query': "evidence-based treatments for generalized anxiety"}),
+    6: ("Search the clinical knowledge base", {'query': "CBT treatment plan goals and progress monitoring"}),
+}
+
+STUB_TASK_EVALUATION = json.dumps({
+    'suggestions': ["Confirm the symptom timeline before moving on."],
+    'quality': 8,
+    'entities': [{'name': "Patient", 'type': "person", 'description': "Patient in a diagnostic assessment",
+                  'relationships': []}],
+})
+
+STUB_PASSAGES = [
+    {'source': "dsm5_criteria.pdf", 'page': 2, 'text': "Excessive anxiety and worry occurring more days than not. " * 8},
+    {'source': "cbt_protocols.pdf", 'page': 5, 'text': "Cognitive restructuring targets catastrophic predictions. " * 8},
+    {'source': "treatment_plan_guidelines.pdf", 'page': 1, 'text': "Goals are specific, measurable and time-bound. " * 8},
+]
+
+# Storage directory name for crew memory during the load test, kept apart from the app's
+LOAD_TEST_STORAGE_DIR = "psych_agent_load_test"
+
+_STEP_PATTERN = re.compile(r"You are in Step (\d+) of a 6-step")
+
+
+def _stub_turn(step: int) -> ConversationTurn:
+    """The canned structured reply for `step`"""
+    if step < 6:
+        reply = "Thank you for sharing that, it helps me understand what you're going through."
+    else:
+        reply = "Here is your complete treatment plan.\n\n" + STUB_TREATMENT_PLAN
+    return ConversationTurn(
+        reply=reply,
+        extracted=ClinicalFields(**STUB_EXTRACTED_FIELDS[step]),
+        step_complete=step < 6,
+        treatment_plan_delivered=step == 6,
+    )
+
+
+class StubLLM(BaseLLM):
+    """
+    Stands in for the OpenAI-backed LLM, answering in the ReAct format the
+    agent executor parses: one tool call where the real agent would search,
+    then the final ConversationTurn JSON
+    """
+
+    latency = 0.0
+
+    def __init__(self, model: str = "stub", temperature: Optional[float] = None, timeout: Optional[float] = None,
+                 **kwargs):
+        super().__init__(model=model, temperature=temperature)
+        self.timeout = timeout
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None):
+        # A real round trip waits on the network with the GIL released, like this sleep
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(messages, str):
+            messages = [{'role': 'user', 'content': messages}]
+        prompt = "\n".join(str(message.get('content', '')) for message in messages)
+
+        # Memory saves ask the agent's LLM to evaluate the finished task
+        if "Assess the quality of the task" in prompt:
+            return STUB_TASK_EVALUATION
+
+        step = min(int(_STEP_PATTERN.search(prompt).group(1)), 6)
+        # Tool observations come back as assistant messages
+        searched = any(message.get('role') == 'assistant' for message in messages)
+        if step in STUB_TOOL_CALLS and not searched:
+            tool_name, tool_input = STUB_TOOL_CALLS[step]
+            return (f"Thought: I should check the references before answering.\n"
+                    f"Action: {tool_name}\nAction Input: {json.dumps(tool_input)}")
+        return f"Thought: I now know the final answer\nFinal Answer: {_stub_turn(step).model_dump_json()}"
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+
+class _StubSerperInput(BaseModel):
+    search_query: str = Field(..., description="Search query")
+
+
+class StubSerperDevTool(BaseTool):
+    """Stands in for SerperDevTool: canned web results, no API call"""
+
+    name: str = "Search the internet with Serper"
+    description: str = "Search the internet with a search_query and return the top results."
+    args_schema: Type[BaseModel] = _StubSerperInput
+
+    def _run(self, search_query: str) -> str:
+        return json.dumps({'searchParameters': {'q': search_query}, 'organic': [
+            {'title': f"Result {i} for {search_query}", 'link': f"https://example.org/{i}",
+             'snippet': "Evidence-based treatment overview. " * 5}
+            for i in range(1, 6)
+        ]})
+
+
+class _StubKnowledgeIndex:
+    """Stands in for a pinned KnowledgeIndex: canned passages, no embedding call"""
+
+    def search(self, query: str, top_k: int = 5, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        return STUB_PASSAGES[:top_k]
+
+
+class _StubKnowledgeStore:
+    """Stands in for the knowledge snapshot store"""
+
+    def __init__(self):
+        self.index = _StubKnowledgeIndex()
+
+    @contextmanager
+    def pin(self):
+        yield self.index
+
+
+class _StubEmbeddingFunction(EmbeddingFunction):
+    """Deterministic local embeddings for crew memory, in place of OpenAI's"""
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return [
+            np.random.default_rng(int(hashlib.md5(text.encode('utf-8')).hexdigest()[:8], 16)).random(64).tolist()
+            for text in input
+        ]
+
+
+@contextmanager
+def stubbed_crew(llm_latency: float = 0.0):
+    """
+    Temporarily stub the LLM, web search, knowledge index, memory embeddings
+    and clinical tables, so turns run the real crew (agent loop, tool
+    dispatch, output parsing and memory) without network calls, PDF parsing
+    or writes to db/. Crew memory goes to a fresh LOAD_TEST_STORAGE_DIR.
+
+    Args:
+        llm_latency (float): Seconds each stubbed LLM call sleeps to model upstream latency
+    """
+    crew_class = crew_module.AgenticRagPsychologicalDiagnosticsTreatmentPlanningSystemCrew
+    original_llm = crew_module.LLM
+    original_serper = crew_module.SerperDevTool
+    original_embedder = crew_class.embedder
+    original_store = message_handler.get_knowledge_store
+    original_tables = message_handler.get_clinical_tables
+    original_storage_dir = os.environ.get('CREWAI_STORAGE_DIR')
+
+    stub_tables = (CriteriaMatcher([]), OutcomeMeasureIndex([]))
+    stub_store = _StubKnowledgeStore()
+    os.environ['CREWAI_STORAGE_DIR'] = LOAD_TEST_STORAGE_DIR
+    # Start every run from empty memory so runs are comparable
+    shutil.rmtree(db_storage_path(), ignore_errors=True)
+    crew_module.LLM = type('StubLLM', (StubLLM,), {'latency': llm_latency})
+    crew_module.SerperDevTool = StubSerperDevTool
+    crew_class.embedder = {'provider': 'custom', 'config': {'embedder': _StubEmbeddingFunction()}}
+    message_handler.get_knowledge_store = lambda: stub_store
+    message_handler.get_clinical_tables = lambda: stub_tables
+    try:
+        yield
+    finally:
+        crew_module.LLM = original_llm
+        crew_module.SerperDevTool = original_serper
+        crew_class.embedder = original_embedder
+        message_handler.get_knowledge_store = original_store
+        message_handler.get_clinical_tables = original_tables
+        if original_storage_dir is None:
+            os.environ.pop('CREWAI_STORAGE_DIR', None)
+        else:
+            os.environ['CREWAI_STORAGE_DIR'] = original_storage_dir
+
+
+def run_patient_session(max_turns: int = 12) -> Dict[str, Any]:
+    """
+    Drive one synthetic patient through the scripted assessment
+
+    Args:
+        max_turns (int): Turns allowed before the session is abandoned
+
+    Returns:
+        dict: Per-turn latencies, turn count, and whether the assessment completed
+    """
+    session_state = initialize_session()
+    latencies = []
+    errors = 0
+
+    for _ in range(max_turns):
+        if is_assessment_complete(session_state):
+            break
+        user_message = PATIENT_SCRIPT[min(get_current_step(session_state), 6)]
+        start = time.perf_counter()
+        response = process_message(user_message, session_state)
+        latencies.append(time.perf_counter() - start)
+        if response.startswith("I apologize, but I encountered an error"):
+            errors += 1
+
+    return {
+        'latencies': latencies,
+        'turns': len(latencies),
+        'errors': errors,
+        'completed': is_assessment_complete(session_state),
+        'session_state': session_state,
+    }
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def _max_rss_bytes() -> int:
+    """Peak resident set size over the whole process lifetime (never decreases)"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _current_rss_bytes() -> int:
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # No /proc (e.g. macOS): the lifetime peak is the closest available figure
+        return _max_rss_bytes()
+
+
+def run_concurrency_level(concurrency: int, sessions_per_worker: int, max_turns: int) -> Dict[str, Any]:
+    """
+    Run `concurrency` worker threads, each driving `sessions_per_worker` patients back to back
+
+    Returns:
+        dict: Throughput, latency percentiles and session outcomes for this level
+    """
+    results = []
+    results_lock = threading.Lock()
+
+    def worker():
+        for _ in range(sessions_per_worker):
+            outcome = run_patient_session(max_turns)
+            outcome.pop('session_state')
+            with results_lock:
+                results.append(outcome)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    gc.collect()
+    rss_before = _current_rss_bytes()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    rss_after = _current_rss_bytes()
+
+    latencies = [latency for outcome in results for latency in outcome['latencies']]
+    turns = len(latencies)
+    return {
+        'concurrency': concurrency,
+        'sessions': len(results),
+        'turns': turns,
+        'elapsed': elapsed,
+        'throughput': turns / elapsed if elapsed else 0.0,
+        'p50': _percentile(latencies, 50),
+        'p95': _percentile(latencies, 95),
+        'p99': _percentile(latencies, 99),
+        'errors': sum(outcome['errors'] for outcome in results),
+        'completed': sum(1 for outcome in results if outcome['completed']),
+        'rss_delta': rss_after - rss_before,
+        'peak_rss': _max_rss_bytes(),
+    }
+
+
+def measure_session_memory(sessions: int, max_turns: int) -> float:
+    """
+    Measure memory retained per completed session
+
+    Sessions are kept alive (as the Streamlit app keeps them in st.session_state)
+    and traced allocations are compared before and after.
+
+    Returns:
+        float: Retained bytes per session
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        retained = [run_patient_session(max_turns)['session_state'] for _ in range(sessions)]
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del retained
+    return (current - baseline) / sessions if sessions else 0.0
+
+
+def find_knee(levels: List[Dict[str, Any]], knee_factor: float) -> Optional[int]:
+    """
+    Find the first concurrency level where latency blows up
+
+    A level is past the knee when its p95 exceeds `knee_factor` times the p95
+    of the lowest concurrency level, or when turns start failing.
+
+    Returns:
+        int or None: The concurrency at the knee, or None if it was not reached
+    """
+    if not levels:
+        return None
+    baseline_p95 = levels[0]['p95']
+    for level in levels[1:]:
+        if level['errors'] or (baseline_p95 and level['p95'] > knee_factor * baseline_p95):
+            return level['concurrency']
+    return None
+
+
+def run_load_test(concurrency_levels: List[int], sessions_per_worker: int = 5, max_turns: int = 12,
+                  llm_latency: float = 0.0, memory_sessions: int = 20,
+                  knee_factor: float = 3.0) -> Dict[str, Any]:
+    """
+    Ramp concurrency against the message handler with a stubbed LLM and tools
+
+    Args:
+        concurrency_levels (list): Concurrent patient counts to ramp through, in order
+        sessions_per_worker (int): Sessions each worker thread runs per level
+        max_turns (int): Turn cap per session
+        llm_latency (float): Simulated seconds per stubbed LLM call
+        memory_sessions (int): Sessions used for the per-session memory probe
+        knee_factor (float): p95 multiple over the first level that counts as blow-up
+
+    Returns:
+        dict: Per-level results, per-session memory growth, the knee concurrency
+        and budget exhaustion counts
+    """
+    with stubbed_crew(llm_latency):
+        # Warm up imports and caches so the first level isn't penalised
+        run_patient_session(max_turns)
+        reset_budget_exhaustion_counts()
+
+        memory_per_session = measure_session_memory(memory_sessions, max_turns)
+        levels = [run_concurrency_level(c, sessions_per_worker, max_turns) for c in concurrency_levels]
+
+    return {
+        'levels': levels,
+        'memory_per_session': memory_per_session,
+        'knee': find_knee(levels, knee_factor),
+        'budget_exhaustion': get_budget_exhaustion_counts(),
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Render load test results as a plain-text table"""
+    lines = [
+        f"{'conc':>5} {'sessions':>9} {'turns':>7} {'turns/s':>10} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'done':>6} {'rss delta MB':>13} "
+        f"{'peak rss MB':>12}"
+    ]
+    for level in report['levels']:
+        lines.append(
+            f"{level['concurrency']:>5} {level['sessions']:>9} {level['turns']:>7} "
+            f"{level['throughput']:>10.1f} {level['p50'] * 1000:>9.2f} {level['p95'] * 1000:>9.2f} "
+            f"{level['p99'] * 1000:>9.2f} {level['errors']:>7} {level['completed']:>6} "
+            f"{level['rss_delta'] / 1e6:>13.1f} {level['peak_rss'] / 1e6:>12.1f}"
+        )
+    lines.append("(rss delta: change in current RSS across the level; peak rss: cumulative process peak so far)")
+    lines.append("")
+    lines.append(f"Memory retained per completed session: {report['memory_per_session'] / 1024:.1f} KiB")
+    if report['knee'] is None:
+        lines.append("Latency knee: not reached in the tested range")
+    else:
+        lines.append(f"Latency knee: p95 blows up at {report['knee']} concurrent patients")
+    exhaustion = report.get('budget_exhaustion') or {}
+    if exhaustion:
+        lines.append("Budget exhaustion events: " + ", ".join(
+            f"step {step} {reason}: {count}" for (step, reason), count in sorted(exhaustion.items())
+        ))
+    else:
+        lines.append("Budget exhaustion events: none")
+    return "\n".join(lines)
+
+
+def run():
+    """
+    Command line entry point for the load test
+    """
+    parser = argparse.ArgumentParser(description="Load test the diagnostic message handler with stubbed LLM and tools")
+    parser.add_argument('--levels', default='1,2,4,8,16,32,64',
+                        help="Comma-separated concurrency levels to ramp through")
+    parser.add_argument('--sessions-per-worker', type=int, default=5)
+    parser.add_argument('--max-turns', type=int, default=12)
+    parser.add_argument('--llm-latency', type=float, default=0.0,
+                        help="Simulated seconds per LLM round trip (0 measures handler overhead only)")
+    parser.add_argument('--memory-sessions', type=int, default=20)
+    parser.add_argument('--knee-factor', type=float, default=3.0)
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(',') if level.strip()]
+
+    print("\n=== Diagnostic Agent Load Test (stubbed LLM and tools) ===\n")
+    report = run_load_test(
+        levels,
+        sessions_per_worker=args.sessions_per_worker,
+        max_turns=args.max_turns,
+        llm_latency=args.llm_latency,
+        memory_sessions=args.memory_sessions,
+        knee_factor=args.knee_factor,
+    )
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    run()
@@ -3,8 +3,43 @@ Message Handler for Conversational Psychological Diagnostic Agent
 Processes individual user messages and maintains session state
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from .crew import AgenticRagPsychologicalDiagnosticsTreatmentPlanningSystemCrew
+from .models import ConversationTurn
+from .budget import StepBudget, TurnBudget, run_with_deadline
+from .knowledge_index import get_knowledge_store
+from .clinical_tables import get_clinical_tables
+
+
+STEP_DESCRIPTIONS = {
+    1: "Symptom Assessment - Gathering detailed symptom information",
+    2: "Duration and Temporal Patterns - Understanding timeline and patterns", 
+    3: "Functional Impact Assessment - Exploring daily life impact",
+    4: "Clinical Diagnosis - Formulating diagnosis based on gathered information",
+    5: "Treatment Options - Presenting treatment options for patient selection",
+    6: "Treatment Plan Generation - Creating comprehensive treatment plan"
+}
+
+# Per-step limits for a single agent turn. Interview steps rarely need tools;
+# diagnosis, options and the plan lean on the knowledge base.
+STEP_BUDGETS = {
+    1: StepBudget(max_iter=4, max_tool_calls=1, deadline_seconds=30),
+    2: StepBudget(max_iter=4, max_tool_calls=1, deadline_seconds=30),
+    3: StepBudget(max_iter=4, max_tool_calls=1, deadline_seconds=30),
+    4: StepBudget(max_iter=8, max_tool_calls=4, deadline_seconds=60),
+    5: StepBudget(max_iter=8, max_tool_calls=4, deadline_seconds=60),
+    6: StepBudget(max_iter=12, max_tool_calls=6, deadline_seconds=120)
+}
+
+# Sent when a turn runs out of time before the agent answers
+STEP_CONTINUATIONS = {
+    1: "Thank you for sharing that. I'm still working through what you've told me about your symptoms - could you tell me a little more about how they've been affecting you while I catch up?",
+    2: "Thank you, that's helpful. I'm still piecing together the timeline you've described - could you tell me more about when things were at their worst?",
+    3: "Thank you for explaining that. I'm still considering how this is affecting your daily life - is there anything else about work, relationships or your routine you'd like me to know?",
+    4: "Thank you for your patience. I'm still reviewing the diagnostic criteria against everything you've shared. Send me any message when you're ready and I'll continue with my assessment.",
+    5: "Thank you for your patience. I'm still reviewing the treatment options that fit your situation. Send me any message when you're ready and I'll continue.",
+    6: "Thank you for your patience. Your treatment plan is taking a little longer to put together. Send me any message when you're ready and I'll continue with it."
+}
 
 
 class ConversationState:
@@ -104,16 +139,33 @@ def process_message(user_message: str, session_state: ConversationState) -> str:
         'selected_treatment_option': session_state.selected_treatment or 'To be selected'
     }
     
+    step = min(session_state.current_step, 6)
+    turn_budget = None
+    
     # Get response from CrewAI agent
     try:
-        crew = AgenticRagPsychologicalDiagnosticsTreatmentPlanningSystemCrew()
-        result = crew.crew().kickoff(inputs=inputs)
+        # Pin the knowledge snapshot so a hot reload mid-turn can't swap it out
+        with get_knowledge_store().pin() as knowledge_index:
+            # Bound this turn by the current step's budget, starting the clock
+            # only once the snapshot is loaded so index warm-up isn't charged to it
+            turn_budget = TurnBudget(step, STEP_BUDGETS[step])
+            crew = AgenticRagPsychologicalDiagnosticsTreatmentPlanningSystemCrew()
+            crew.turn_budget = turn_budget
+            crew.knowledge_index = knowledge_index
+            # Wait no longer than the deadline; an overrunning kickoff is
+            # abandoned to finish in the background, still held to max_iter,
+            # the tool budget and the LLM request timeout
+            result = run_with_deadline(crew.crew().kickoff, turn_budget.remaining(), inputs=inputs)
         
-        # Extract agent response
-        agent_response = str(result.raw) if hasattr(result, 'raw') else str(result)
-        
-        # Update session state based on response and current step
-        _update_session_state(session_state, user_message, agent_response)
+        # Prefer the structured turn: reply and extracted fields in one call
+        turn = _parse_structured_turn(result)
+        if turn is not None:
+            agent_response = turn.reply
+            _apply_structured_turn(session_state, turn)
+        else:
+            # Fall back to heuristics when the structured output could not be parsed
+            agent_response = str(result.raw) if hasattr(result, 'raw') else str(result)
+            _update_session_state(session_state, user_message, agent_response)
         
         # Add agent response to conversation history
         session_state.conversation_history.append({
@@ -125,6 +177,17 @@ def process_message(user_message: str, session_state: ConversationState) -> str:
         return agent_response
         
     except Exception as e:
+        # Out of time: answer gracefully and pick up again on the next message
+        if turn_budget is not None and (isinstance(e, TimeoutError) or turn_budget.expired()):
+            turn_budget.record_exhaustion('deadline')
+            partial_response = STEP_CONTINUATIONS[step]
+            session_state.conversation_history.append({
+                'role': 'agent',
+                'content': partial_response,
+                'step': session_state.current_step
+            })
+            return partial_response
+        
         error_msg = f"I apologize, but I encountered an error processing your message. Please try again. Error: {str(e)}"
         session_state.conversation_history.append({
             'role': 'agent',
@@ -134,6 +197,21 @@ def process_message(user_message: str, session_state: ConversationState) -> str:
         return error_msg
 
 
+def _parse_structured_turn(result) -> Optional[ConversationTurn]:
+    """The crew's ConversationTurn, parsed from the raw output if crewai could not convert it"""
+    turn = getattr(result, 'pydantic', None)
+    if isinstance(turn, ConversationTurn):
+        return turn
+    raw = str(result.raw if hasattr(result, 'raw') else result).strip()
+    # Models sometimes wrap the JSON in a markdown code fence
+    if raw.startswith("```"):
+        raw = raw.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        return ConversationTurn.model_validate_json(raw)
+    except ValueError:
+        return None
+
+
 def _build_context(session_state: ConversationState, user_message: str) -> str:
     """Build context string for the agent based on current session state"""
     
@@ -142,18 +220,9 @@ def _build_context(session_state: ConversationState, user_message: str) -> str:
     # Add current step information
     context_parts.append(f"Current Diagnostic Step: {session_state.current_step}")
     
-    # Add step descriptions
-    step_descriptions = {
-        1: "Symptom Assessment - Gathering detailed symptom information",
-        2: "Duration and Temporal Patterns - Understanding timeline and patterns", 
-        3: "Functional Impact Assessment - Exploring daily life impact",
-        4: "Clinical Diagnosis - Formulating diagnosis based on gathered information",
-        5: "Treatment Options - Presenting treatment options for patient selection",
-        6: "Treatment Plan Generation - Creating comprehensive treatment plan"
-    }
-    
+    # Add step description
     if session_state.current_step <= 6:
-        context_parts.append(f"Focus: {step_descriptions[session_state.current_step]}")
+        context_parts.append(f"Focus: {STEP_DESCRIPTIONS[session_state.current_step]}")
     
     # Add COLLECTED INFORMATION to prevent duplicate questions
     context_parts.append("\n**Information Already Collected:**")
@@ -167,6 +236,8 @@ def _build_context(session_state: ConversationState, user_message: str) -> str:
             symptom_info.append(f"- Frequency: {session_state.symptoms_collected['frequency']}")
         if session_state.symptoms_collected['triggers']:
             symptom_info.append(f"- Triggers: {', '.join(session_state.symptoms_collected['triggers'])}")
+        if session_state.symptoms_collected['specific_symptoms']:
+            symptom_info.append(f"- Specific symptoms: {', '.join(session_state.symptoms_collected['specific_symptoms'])}")
         if session_state.symptoms_collected['eating_issues']:
             symptom_info.append("- Eating difficulties: Yes (no appetite)")
         if session_state.symptoms_collected['reality_perception']:
@@ -195,6 +266,8 @@ def _build_context(session_state: ConversationState, user_message: str) -> str:
         impact_info = []
         if session_state.functional_impact_info['work_impact']:
             impact_info.append(f"- Work impact: {session_state.functional_impact_info['work_impact']}")
+        if session_state.functional_impact_info['relationship_impact']:
+            impact_info.append(f"- Relationship impact: {session_state.functional_impact_info['relationship_impact']}")
         if session_state.functional_impact_info['daily_activities']:
             impact_info.append(f"- Daily activities: {session_state.functional_impact_info['daily_activities']}")
         
@@ -240,6 +313,9 @@ def _build_context(session_state: ConversationState, user_message: str) -> str:
         else:
             context_parts.append("✓ Sufficient information collected for Step 3. Ready to move to Step 4.")
     
+    # Add precompiled clinical references for diagnosis and treatment steps
+    context_parts.extend(_clinical_reference_context(session_state))
+    
     # Add conversation summary
     if session_state.conversation_history:
         recent_messages = session_state.conversation_history[-4:]  # Last 4 messages for context
@@ -250,6 +326,56 @@ def _build_context(session_state: ConversationState, user_message: str) -> str:
     return "\n".join(context_parts)
 
 
+def _clinical_reference_context(session_state: ConversationState) -> List[str]:
+    """Ranked DSM-5 candidates for Step 4 and outcome measures for Steps 5-6, from the precompiled tables"""
+    
+    if session_state.current_step < 4:
+        return []
+    
+    # The tables are a shortcut, not a requirement: without them the agent falls back to knowledge search
+    try:
+        criteria_matcher, outcome_measures = get_clinical_tables()
+        candidates = criteria_matcher.match(
+            session_state.symptoms_collected,
+            session_state.duration_info,
+            session_state.functional_impact_info
+        )
+    except Exception as e:
+        print(f"Clinical reference context unavailable: {e}")
+        return []
+    
+    context_parts = []
+    if session_state.current_step == 4 and candidates:
+        context_parts.append("\n**DSM-5 Criteria Match (ranked candidates from collected information):**")
+        for candidate in candidates:
+            line = f"- {candidate['name']} ({candidate['code']}): {candidate['score']:.0%} match"
+            if candidate['criteria_met']:
+                line += f"; criteria met: {', '.join(candidate['criteria_met'])}"
+            if candidate['duration']:
+                line += f"; duration {candidate['duration']}"
+            if candidate['matched_items']:
+                line += f"; matching symptoms: {'; '.join(candidate['matched_items'])}"
+            if candidate['rule_out']:
+                line += f"; rule out: {'; '.join(candidate['rule_out'])}"
+            context_parts.append(line)
+    
+    if session_state.current_step >= 5:
+        condition = session_state.diagnosis or (candidates[0]['name'] if candidates else '')
+        instruments = outcome_measures.for_condition(condition)
+        if instruments:
+            context_parts.append("\n**Recommended Outcome Measures:**")
+            for instrument in instruments:
+                line = f"- {instrument['name']} ({instrument['abbreviation']}) - {instrument['domain']}"
+                if instrument['score_bands']:
+                    bands = ", ".join(f"{band['low']}-{band['high']} {band['label'].split(';')[0]}" for band in instrument['score_bands'])
+                    line += f"; score bands: {bands}"
+                if instrument['facts']:
+                    line += f"; {'; '.join(instrument['facts'][:3])}"
+                context_parts.append(line)
+    
+    return context_parts
+
+
 def _extract_initial_concerns(session_state: ConversationState) -> str:
     """Extract initial patient concerns from conversation history"""
     if session_state.conversation_history:
@@ -258,6 +384,49 @@ def _extract_initial_concerns(session_state: ConversationState) -> str:
     return 'General psychological assessment requested'
 
 
+def _apply_structured_turn(session_state: ConversationState, turn: ConversationTurn):
+    """Update session state directly from the agent's structured turn output"""
+    
+    fields = turn.extracted
+    
+    # Scalar fields: keep the latest non-empty value
+    for target, keys in (
+        (session_state.symptoms_collected, ['severity', 'frequency']),
+        (session_state.duration_info, ['symptom_duration', 'pattern']),
+        (session_state.functional_impact_info, ['work_impact', 'relationship_impact', 'daily_activities']),
+    ):
+        for key in keys:
+            value = getattr(fields, key)
+            if value:
+                target[key] = value
+    
+    # List fields: accumulate without duplicates
+    for target, key in (
+        (session_state.symptoms_collected, 'triggers'),
+        (session_state.symptoms_collected, 'specific_symptoms'),
+        (session_state.functional_impact_info, 'coping_mechanisms'),
+    ):
+        for item in getattr(fields, key):
+            if item and item not in target[key]:
+                target[key].append(item)
+    
+    if fields.diagnosis:
+        session_state.diagnosis = fields.diagnosis
+    if fields.selected_treatment and not session_state.selected_treatment:
+        session_state.selected_treatment = fields.selected_treatment
+    
+    # Step advance: the agent's decision, or the collected data once it is sufficient
+    step = session_state.current_step
+    if step < 6 and (turn.step_complete or _check_step_completion(session_state, step)):
+        session_state.step_completion_status[step]['complete'] = True
+        session_state.current_step = step + 1
+    
+    if turn.treatment_plan_delivered and session_state.current_step == 6:
+        session_state.step_completion_status[6]['complete'] = True
+        session_state.treatment_plan_generated = True
+        session_state.assessment_complete = True
+
+
 def _update_session_state(session_state: ConversationState, user_message: str, agent_response: str):
     """Update session state based on user message and agent response"""
     
@@ -338,28 +507,6 @@ def _update_session_state(session_state: ConversationState, user_message: str, a
             session_state.current_step = 4
             session_state.step_completion_status[3]['complete'] = True
     
-    # Also check if agent explicitly indicates moving to next step
-    step_phrases = [
-        ("step 1 complete", 2),
-        ("moving to step 2", 2),
-        ("step 2 complete", 3),
-        ("moving to step 3", 3),
-        ("step 3 complete", 4),
-        ("moving to step 4", 4),
-        ("step 4 complete", 5),
-        ("moving to step 5", 5),
-        ("step 5 complete", 6),
-        ("moving to step 6", 6)
-    ]
-    
-    for phrase, next_step in step_phrases:
-        if phrase in agent_lower:
-            if next_step > session_state.current_step:
-                session_state.current_step = next_step
-                if next_step > 1:
-                    session_state.step_completion_status[next_step - 1]['complete'] = True
-            break
-    
     # Check for treatment selection in step 5
     if session_state.current_step == 5 and not session_state.selected_treatment:
         treatment_indicators = ['option 1', 'option 2', 'option 3', 'first', 'second', 'third', 'cbt', 'dbt']
@@ -396,7 +543,8 @@ def _check_step_completion(session_state: ConversationState, step: int) -> bool:
         has_triggers = len(session_state.symptoms_collected['triggers']) > 0
         has_symptoms = (session_state.symptoms_collected['eating_issues'] is not None or 
                        session_state.symptoms_collected['sleep_issues'] is not None or
-                       session_state.symptoms_collected['reality_perception'] is not None)
+                       session_state.symptoms_collected['reality_perception'] is not None or
+                       len(session_state.symptoms_collected['specific_symptoms']) > 0)
         has_coping = len(session_state.functional_impact_info['coping_mechanisms']) > 0
         
         return has_severity and has_triggers and has_symptoms and has_coping
@@ -0,0 +1,32 @@
+"""
+Structured Output Models for the Conversational Diagnostic Agent
+A single conversational turn returns the reply together with the clinical
+fields extracted from the patient's message and the step-advance decision.
+"""
+
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+
+class ClinicalFields(BaseModel):
+    """Clinical information stated by the patient in the current message"""
+    severity: Optional[str] = Field(None, description="Symptom severity as stated, e.g. 'anxiety 9/10'.")
+    frequency: Optional[str] = Field(None, description="How often symptoms occur.")
+    triggers: List[str] = Field(default_factory=list, description="Situations or stressors that bring symptoms on.")
+    specific_symptoms: List[str] = Field(default_factory=list, description="Concrete symptoms, e.g. 'insomnia', 'loss of appetite'.")
+    symptom_duration: Optional[str] = Field(None, description="How long symptoms have been present.")
+    pattern: Optional[str] = Field(None, description="Whether symptoms are episodic or continuous.")
+    work_impact: Optional[str] = Field(None, description="Effect of symptoms on work or school.")
+    relationship_impact: Optional[str] = Field(None, description="Effect of symptoms on relationships.")
+    daily_activities: Optional[str] = Field(None, description="Effect of symptoms on daily routine and self-care.")
+    coping_mechanisms: List[str] = Field(default_factory=list, description="What the patient does that helps.")
+    diagnosis: Optional[str] = Field(None, description="Diagnosis presented in this reply (Step 4 only).")
+    selected_treatment: Optional[str] = Field(None, description="Treatment option the patient chose (Step 5 only).")
+
+
+class ConversationTurn(BaseModel):
+    """Reply to the patient plus everything the handler needs to update session state"""
+    reply: str = Field(..., description="The message shown to the patient.")
+    extracted: ClinicalFields = Field(default_factory=ClinicalFields, description="Fields newly stated by the patient in this message.")
+    step_complete: bool = Field(False, description="True when the current step has enough information to move to the next step.")
+    treatment_plan_delivered: bool = Field(False, description="True when the reply contains the complete treatment plan (Step 6 only).")
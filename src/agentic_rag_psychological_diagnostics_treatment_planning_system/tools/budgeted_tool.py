@@ -0,0 +1,49 @@
+from typing import Any
+from crewai.tools import BaseTool
+from ..budget import run_with_deadline
+
+
+BUDGET_EXHAUSTED_MESSAGE = (
+    "The tool budget for this step is used up. Do not call any more tools; "
+    "give your final answer now using the information you already have."
+)
+
+DEADLINE_EXCEEDED_MESSAGE = (
+    "The tool did not finish before this step's deadline. Do not call any more tools; "
+    "give your final answer now using the information you already have."
+)
+
+
+class BudgetedTool(BaseTool):
+    """Wraps another tool so every call is charged against the current turn budget"""
+    tool: Any
+    budget: Any
+
+    @classmethod
+    def wrap(cls, tool: BaseTool, budget) -> "BudgetedTool":
+        return cls(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            tool=tool,
+            budget=budget,
+        )
+
+    def _generate_description(self):
+        # The description is copied from the wrapped tool, which has already formatted it
+        pass
+
+    def _run(self, **kwargs) -> str:
+        if not self.budget.try_acquire_tool_call():
+            return BUDGET_EXHAUSTED_MESSAGE
+
+        timeout = self.budget.tool_time_remaining()
+        try:
+            if hasattr(self.tool, 'run_with_timeout'):
+                # The tool bounds its own requests, so nothing outlives the call
+                return self.tool.run_with_timeout(timeout, **kwargs)
+            # Anything else runs on its own thread so an overrun can be abandoned
+            return run_with_deadline(self.tool.run, timeout, **kwargs)
+        except TimeoutError:
+            self.budget.record_exhaustion('deadline')
+            return DEADLINE_EXCEEDED_MESSAGE
@@ -0,0 +1,36 @@
+from crewai.tools import BaseTool
+from typing import Any, Optional, Type
+from pydantic import BaseModel, Field
+
+
+class KnowledgeSearchToolInput(BaseModel):
+    """Input schema for KnowledgeSearchTool."""
+    query: str = Field(..., description="Descriptive semantic search query, e.g. 'DSM-5 criteria for generalized anxiety disorder'.")
+
+
+class KnowledgeSearchTool(BaseTool):
+    name: str = "Search the clinical knowledge base"
+    description: str = (
+        "Semantic search over the clinical knowledge base PDFs: DSM-5 criteria, CBT protocols, "
+        "DBT treatment manual, treatment plan guidelines, communication standards and outcome measures. "
+        "Returns the most relevant passages with their source document and page."
+    )
+    args_schema: Type[BaseModel] = KnowledgeSearchToolInput
+    index: Any
+    top_k: int = 5
+
+    def _run(self, query: str) -> str:
+        return self._search(query)
+
+    def run_with_timeout(self, timeout: float, query: str) -> str:
+        """Search with the query embedding request bounded by `timeout` seconds; raises TimeoutError"""
+        return self._search(query, timeout)
+
+    def _search(self, query: str, timeout: Optional[float] = None) -> str:
+        results = self.index.search(query, top_k=self.top_k, timeout=timeout)
+        if not results:
+            return "No relevant passages found in the knowledge base."
+        return "\n\n".join(
+            f"[{result['source']}, page {result['page']}]\n{result['text']}"
+            for result in results
+        )
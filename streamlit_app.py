@@ -5,6 +5,10 @@ Streamlit Chat Interface for Agentic Psychological Diagnostics & Treatment Plann
 import streamlit as st
 import sys
 import os
+import time
+
+# Capture rerun start before any widgets render so the timing covers the whole script
+rerun_start = time.perf_counter()
 
 # Load Streamlit secrets and set environment variables
 os.environ['OPENAI_API_KEY'] = st.secrets['OPENAI_API_KEY']
@@ -14,6 +18,7 @@ os.environ['CREWAI_STORAGE_DIR'] = st.secrets['CREWAI_STORAGE_DIR']
 # Add the src directory to the path so we can import our modules
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
+from src.agentic_rag_psychological_diagnostics_treatment_planning_system.budget import get_budget_exhaustion_counts
 from src.agentic_rag_psychological_diagnostics_treatment_planning_system.message_handler import (
     process_message, 
     initialize_session, 
@@ -30,10 +35,44 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize session state
+# Most recent messages always rendered in full; older history is paged in on demand
+HISTORY_WINDOW = 20
+HISTORY_PAGE_SIZE = 20
+# Number of (message count, rerun seconds) samples kept for the timing panel
+RERUN_TIMING_SAMPLES = 200
+
+
+def reset_chat_state():
+    """Reset per-session chat display state"""
+    st.session_state.messages = []
+    st.session_state.history_pages_shown = 0
+    st.session_state.treatment_plan_index = None
+
+
+def _find_treatment_plan_index(messages):
+    """Locate the treatment plan in a history recorded before its index was tracked"""
+    # The plan is the latest such message; index 0 is the welcome message, which mentions "Treatment Plan" too
+    for i in range(len(messages) - 1, 0, -1):
+        if messages[i]["role"] == "assistant" and "treatment plan" in messages[i]["content"].lower():
+            return i
+    return None
+
+
+# Initialize session state; each key on its own, so sessions that predate a key pick it up
 if 'conversation_state' not in st.session_state:
     st.session_state.conversation_state = initialize_session()
+    reset_chat_state()
+if 'messages' not in st.session_state:
     st.session_state.messages = []
+if 'history_pages_shown' not in st.session_state:
+    st.session_state.history_pages_shown = 0
+if 'treatment_plan_index' not in st.session_state:
+    st.session_state.treatment_plan_index = (
+        _find_treatment_plan_index(st.session_state.messages)
+        if is_assessment_complete(st.session_state.conversation_state) else None
+    )
+if 'rerun_timings' not in st.session_state:
+    st.session_state.rerun_timings = []
 
 # Sidebar with session info
 with st.sidebar:
@@ -64,10 +103,13 @@ with st.sidebar:
     st.write(f"**Messages**: {len(st.session_state.messages)}")
     st.write(f"**Assessment Complete**: {'✅' if is_assessment_complete(st.session_state.conversation_state) else '⏳'}")
     
+    # Filled in at the end of the script once this rerun has been timed
+    rerun_timing_placeholder = st.empty()
+    
     # Reset button
     if st.button("🔄 New Assessment", type="secondary"):
         st.session_state.conversation_state = initialize_session()
-        st.session_state.messages = []
+        reset_chat_state()
         st.experimental_rerun()
 
 # Main chat interface
@@ -91,11 +133,33 @@ if not st.session_state.messages:
     """
     st.session_state.messages.append({"role": "assistant", "content": welcome_msg})
 
-# Display conversation history
-for message in st.session_state.messages:
+# Display conversation history: only the recent window is rendered on every
+# rerun, older messages stay hidden until the user pages them in
+messages = st.session_state.messages
+window_start = max(0, len(messages) - HISTORY_WINDOW)
+shown_start = max(0, window_start - st.session_state.history_pages_shown * HISTORY_PAGE_SIZE)
+
+if shown_start > 0:
+    if st.button(f"⬆️ Show earlier messages ({shown_start} hidden)"):
+        st.session_state.history_pages_shown += 1
+        st.experimental_rerun()
+if st.session_state.history_pages_shown and st.button("⬇️ Collapse earlier messages"):
+    st.session_state.history_pages_shown = 0
+    st.experimental_rerun()
+
+if shown_start < window_start:
+    with st.expander(f"Earlier messages ({window_start - shown_start})", expanded=True):
+        for message in messages[shown_start:window_start]:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+
+for message in messages[window_start:]:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
+# Time spent waiting on the agent, excluded from the rerun timing below
+agent_seconds = 0.0
+
 # Chat input
 if prompt := st.chat_input("Type your message here..."):
     # Add user message to chat history
@@ -110,12 +174,20 @@ if prompt := st.chat_input("Type your message here..."):
         with st.spinner("Processing your message..."):
             try:
                 # Process message through CrewAI agent
+                was_complete = is_assessment_complete(st.session_state.conversation_state)
+                agent_start = time.perf_counter()
                 response = process_message(prompt, st.session_state.conversation_state)
+                agent_seconds = time.perf_counter() - agent_start
                 st.markdown(response)
                 
                 # Add assistant response to chat history
                 st.session_state.messages.append({"role": "assistant", "content": response})
                 
+                # Remember which message carries the plan when it is produced,
+                # so completion doesn't rescan the whole history every rerun
+                if not was_complete and is_assessment_complete(st.session_state.conversation_state):
+                    st.session_state.treatment_plan_index = len(st.session_state.messages) - 1
+                
             except Exception as e:
                 error_message = f"I apologize, but I encountered an error processing your message. Please try again.\n\nError: {str(e)}"
                 st.error(error_message)
@@ -129,12 +201,10 @@ st.markdown("**Note**: This AI assessment tool is for educational and informatio
 if is_assessment_complete(st.session_state.conversation_state):
     st.success("🎉 Assessment Complete! Your treatment plan has been generated.")
     
-    # Extract treatment plan from conversation
+    # Treatment plan message recorded when the assessment completed
     treatment_plan_content = ""
-    for msg in st.session_state.messages:
-        if msg["role"] == "assistant" and "treatment plan" in msg["content"].lower():
-            treatment_plan_content = msg["content"]
-            break
+    if st.session_state.treatment_plan_index is not None:
+        treatment_plan_content = st.session_state.messages[st.session_state.treatment_plan_index]["content"]
     
     if treatment_plan_content:
         st.download_button(
@@ -143,4 +213,31 @@ if is_assessment_complete(st.session_state.conversation_state):
             file_name="psychological_treatment_plan.md",
             mime="text/markdown",
             type="primary"
-        )
\ No newline at end of file
+        )
+
+# Record how long this rerun took against the session length
+rerun_seconds = time.perf_counter() - rerun_start - agent_seconds
+st.session_state.rerun_timings.append((len(st.session_state.messages), rerun_seconds))
+del st.session_state.rerun_timings[:-RERUN_TIMING_SAMPLES]
+
+with rerun_timing_placeholder.container():
+    st.write(f"**Last Rerun**: {rerun_seconds * 1000:.1f} ms ({len(st.session_state.messages)} messages)")
+    with st.expander("⏱️ Rerun time vs session length"):
+        st.line_chart(
+            {
+                "messages": [count for count, _ in st.session_state.rerun_timings],
+                "rerun ms": [seconds * 1000 for _, seconds in st.session_state.rerun_timings],
+            },
+            x="messages",
+            y="rerun ms",
+        )
+    # Process-wide count of turns cut short by their step budget
+    exhaustion = get_budget_exhaustion_counts()
+    with st.expander(f"⏳ Turn budget exhaustion ({sum(exhaustion.values())})"):
+        if exhaustion:
+            st.table([
+                {"step": step, "reason": reason, "turns": count}
+                for (step, reason), count in sorted(exhaustion.items())
+            ])
+        else:
+            st.write("No turn has hit its budget yet.")
@@ -0,0 +1,94 @@
+"""Regression checks for CriteriaMatcher.match against the compiled DSM-5 criteria table"""
+
+import os
+
+import pytest
+
+pytest.importorskip("pypdf")
+
+from agentic_rag_psychological_diagnostics_treatment_planning_system.clinical_tables import (
+    DSM5_CRITERIA_PDF,
+    CriteriaMatcher,
+    _pdf_lines,
+    compile_dsm5_criteria,
+    concepts_in,
+)
+from agentic_rag_psychological_diagnostics_treatment_planning_system.knowledge_index import KNOWLEDGE_DIR
+
+MDD = "Major Depressive Disorder"
+GAD = "Generalized Anxiety Disorder"
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return CriteriaMatcher(compile_dsm5_criteria(_pdf_lines(os.path.join(KNOWLEDGE_DIR, DSM5_CRITERIA_PDF))))
+
+
+def _names(candidates):
+    return [candidate['name'] for candidate in candidates]
+
+
+def test_mdd_core_symptoms_are_required_items(matcher):
+    mdd = next(disorder for disorder in matcher.disorders if disorder['name'] == MDD)
+    assert mdd['criteria'][0]['groups'][0]['required_items'] == [0, 1]
+
+
+def test_pure_gad_presentation_ranks_gad_first(matcher):
+    candidates = matcher.match(
+        {'description': "I worry all the time, my anxiety is 9 out of 10, I feel restless and tired and I can't sleep",
+         'eating_issues': "no appetite"},
+        {'duration': "8 months"},
+        {'work_impact': "missing deadlines at work"},
+    )
+    names = _names(candidates)
+    assert names[0] == GAD
+    # Appetite, sleep, restlessness and fatigue without depressed mood or anhedonia
+    assert MDD not in names
+
+
+def test_depression_presentation_ranks_mdd_first(matcher):
+    candidates = matcher.match(
+        {'description': "I feel depressed and hopeless, I have lost interest in everything, I am tired all the time, "
+                        "I can't sleep, I feel worthless and I can't concentrate"},
+        {'duration': "3 months"},
+        {'work_impact': "I can't work"},
+    )
+    assert candidates[0]['name'] == MDD
+    assert candidates[0]['symptoms_met']
+
+
+def _criterion(id, text, items=(), min_count=1, duration_days=None, impairment=False):
+    groups = [{'label': None, 'min_count': min_count, 'required_items': [], 'items': list(items)}] if items else []
+    return {'id': id, 'text': text, 'groups': groups, 'duration_days': duration_days,
+            'exclusion': False, 'impairment': impairment}
+
+
+def test_fully_met_disorder_outranks_partial_credit():
+    matcher = CriteriaMatcher([
+        {'name': "Partial", 'code': "000.1", 'criteria': [
+            _criterion('A', "Five of the following for 2 weeks",
+                       ["Depressed mood", "Insomnia", "Fatigue", "Loss of appetite", "Worthlessness"],
+                       min_count=5, duration_days=14),
+            _criterion('B', "Clinically significant distress or impairment", impairment=True),
+        ]},
+        {'name': "Met", 'code': "000.2", 'criteria': [
+            _criterion('A', "Two of the following for 6 months", ["Excessive worry", "Restlessness"],
+                       min_count=2, duration_days=180),
+        ]},
+    ])
+    candidates = matcher.match(
+        {'description': "I feel sad and worried, I'm restless, tired and can't sleep", 'eating_issues': "no appetite"},
+        {'duration': "3 months"},
+        {'work_impact': "missing deadlines"},
+    )
+    # 4 of 5 items with duration and impairment (85%) against every item without the duration (75%)
+    assert [(candidate['name'], round(candidate['score'], 2)) for candidate in candidates] == [("Met", 0.75), ("Partial", 0.85)]
+
+
+@pytest.mark.parametrize("text", [
+    "I was downloading files at work",
+    "Everything is under control",
+    "I've been dealing with the death of my father",
+])
+def test_ambiguous_words_are_not_symptoms(text):
+    assert not concepts_in(text) & {'depressed_mood', 'uncontrollable', 'suicidal'}